@@ -0,0 +1,169 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import current_app, g, has_request_context
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.url import make_url
+
+#----------------------------------------------------------------------------#
+# Async reads.
+#----------------------------------------------------------------------------#
+
+# With ASYNC_READS on, the read views in app.py run as async views on one
+# long-lived event loop per worker process and send their queries through
+# an asyncpg pool on that loop, so a view can await its independent queries
+# together, e.g. a profile row and its past and upcoming shows. Queries are
+# built with the same models and query functions as the sync views and
+# compiled for Postgres; writes, the JSON API and the CLI stay on
+# SQLAlchemy. Needs the asyncpg package.
+
+# SQLAlchemy's numeric paramstyle renders :1, :2, ...; asyncpg wants $1, $2.
+NUMERIC_PARAM = re.compile(r'(?<![:\w]):(\d+)')
+
+class _AsyncReadsState(object):
+  """An app's event loop and asyncpg pool, in the process that started
+  them."""
+
+  def __init__(self, config, enabled):
+    self.config = config
+    self.enabled = enabled
+    self.loop = None
+    self.pool = None
+    self.pid = None
+    self.lock = threading.Lock()
+
+class AsyncReads(object):
+  """Async reads for every app it is initialised with; each keeps its
+  loop and pool in app.extensions['async_reads']."""
+
+  def __init__(self, app=None):
+    self._dialect = postgresql.dialect(paramstyle='numeric')
+    self._row_types = {}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    enabled = app.config.get('ASYNC_READS', False)
+    app.extensions['async_reads'] = _AsyncReadsState(app.config, enabled)
+    if enabled:
+      # Flask runs async views through app.async_to_sync
+      app.async_to_sync = self.async_to_sync
+
+  @property
+  def enabled(self):
+    return current_app.extensions['async_reads'].enabled
+
+  @property
+  def pool(self):
+    return current_app.extensions['async_reads'].pool
+
+  def pool_options(self, config):
+    """asyncpg pool options from the same DB_* settings as pool.py."""
+    options = {
+      "min_size": config['DB_POOL_SIZE'],
+      "max_size": config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW'],
+      "timeout": config['DB_POOL_TIMEOUT'],
+      "max_inactive_connection_lifetime": config['DB_POOL_RECYCLE']
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_PGBOUNCER']:
+      # asyncpg prepares every statement, which PgBouncer's transaction
+      # pooling cannot route; no startup options either, see pool.py
+      options["statement_cache_size"] = 0
+      if timeout:
+        options["command_timeout"] = timeout / 1000.0
+    elif timeout:
+      options["server_settings"] = {"statement_timeout": str(timeout)}
+    return options
+
+  # event loop
+
+  def start(self):
+    """Start the current app's event loop thread and pool, once per
+    process and on first use, so forked workers each get their own, and
+    return its state."""
+    state = current_app.extensions['async_reads']
+    if state.pid == os.getpid():
+      return state
+    with state.lock:
+      if state.pid == os.getpid():
+        return state
+      loop = asyncio.new_event_loop()
+      threading.Thread(target=loop.run_forever, name='async-reads', daemon=True).start()
+      state.pool = asyncio.run_coroutine_threadsafe(self._create_pool(state.config), loop).result()
+      state.loop = loop
+      state.pid = os.getpid()
+    return state
+
+  async def _create_pool(self, config):
+    import asyncpg
+
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    url.drivername = 'postgresql'
+    return await asyncpg.create_pool(str(url), **self.pool_options(config))
+
+  def async_to_sync(self, func):
+    """Run a coroutine function on the shared loop from a worker thread.
+
+    The coroutine keeps the calling thread's context variables, so request,
+    g and current_app work in async views as in sync ones.
+    """
+    @wraps(func)
+    def run(*args, **kwargs):
+      return asyncio.run_coroutine_threadsafe(func(*args, **kwargs), self.start().loop).result()
+    return run
+
+  # queries
+
+  def compile(self, query):
+    compiled = getattr(query, 'statement', query).compile(dialect=self._dialect)
+    params = compiled.construct_params()
+    return NUMERIC_PARAM.sub(r'$\1', compiled.string), [params[name] for name in compiled.positiontup]
+
+  def row_type(self, keys):
+    row_type = self._row_types.get(keys)
+    if row_type is None:
+      row_type = self._row_types[keys] = namedtuple('Row', keys, rename=True)
+    return row_type
+
+  async def fetch(self, query):
+    """Return the rows of a SQLAlchemy query or select as named tuples, like
+    Query.all() on column queries."""
+    sql, params = self.compile(query)
+    started = time.perf_counter()
+    records = await self.pool.fetch(sql, *params)
+    seconds = time.perf_counter() - started
+    if has_request_context() and 'profile' in g:
+      g.profile.record_query(sql, seconds)
+    if not records:
+      return []
+    row_type = self.row_type(tuple(records[0].keys()))
+    return [row_type(*record) for record in records]
+
+  async def fetch_all(self, *queries):
+    """fetch() the queries concurrently, each on its own connection."""
+    return await asyncio.gather(*[self.fetch(query) for query in queries])
+
+  async def scalar(self, query):
+    rows = await self.fetch(query)
+    return rows[0][0] if rows else None
+
+  def stats(self):
+    state = current_app.extensions['async_reads']
+    if state.pool is None:
+      return {"enabled": state.enabled, "started": False}
+    return {
+      "enabled": state.enabled,
+      "started": True,
+      "size": state.pool.get_size(),
+      "idle": state.pool.get_idle_size(),
+      "min_size": state.pool.get_min_size(),
+      "max_size": state.pool.get_max_size()
+    }
+
+async_reads = AsyncReads()
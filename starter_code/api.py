@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+
+from catalog import (venue_page, artist_page, shows_page, venue_version, artist_version,
+                     nearest_venues, NEAR_VENUES, MAX_NEAR_VENUES)
+from geocoder import location
+from cache import page_cache
+from models import db, Venue, Artist
+from scheduling import MAX_TOUR_DATES, book_tour, free_slots
+
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#----------------------------------------------------------------------------#
+
+# Serves the same data as the venue, artist and shows pages. Every response
+# carries a strong ETag derived from row versions, and a matching
+# If-None-Match is answered with 304 before anything is loaded or encoded.
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+def not_modified(etag):
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+  return None
+
+def json_response(data, etag):
+  response = jsonify(data)
+  response.set_etag(etag)
+  return response
+
+def show_times(data, *keys):
+  # the pages pass datetimes to the template filter, the API keeps sending
+  # its "YYYY-MM-DD HH:MM:SS" start times
+  for key in keys:
+    for show in data[key]:
+      show["start_time"] = str(show["start_time"])
+  return data
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+  etag = venue_version(venue_id)
+  if etag is None:
+    abort(404)
+  return not_modified(etag) or json_response(show_times(venue_page(venue_id), 'past_shows', 'upcoming_shows'), etag)
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+  etag = artist_version(artist_id)
+  if etag is None:
+    abort(404)
+  return not_modified(etag) or json_response(show_times(artist_page(artist_id), 'past_shows', 'upcoming_shows'), etag)
+
+@api.route('/shows')
+def shows():
+  data, next_cursor, etag = shows_page(request.args.get('after'), current_app.config['PAGE_SIZE'])
+  return not_modified(etag) or json_response(show_times({"shows": data, "next": next_cursor}, 'shows'), etag)
+
+@api.route('/venues/near')
+def venues_near():
+  # ?lat=40.71&lon=-74.01&k=5, or ?city=Brooklyn&state=NY to start from a
+  # city centre; k defaults to NEAR_VENUES
+  try:
+    lat, lon = location(request.args)
+  except ValueError as e:
+    abort(400, str(e))
+  k = request.args.get('k', NEAR_VENUES, type=int)
+  if not 1 <= k <= MAX_NEAR_VENUES:
+    abort(400, 'k must be a number from 1 to %d' % MAX_NEAR_VENUES)
+  return jsonify({"latitude": lat, "longitude": lon, "venues": nearest_venues(lat, lon, k)})
+
+# longest range /venues/<id>/free-slots answers for at once
+MAX_FREE_SLOTS_RANGE = timedelta(days=92)
+
+def datetime_arg(name):
+  value = request.args.get(name)
+  if not value:
+    abort(400, '%s is required' % name)
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    abort(400, '%s must be an ISO date or date and time' % name)
+
+@api.route('/venues/<int:venue_id>/free-slots')
+def venue_free_slots(venue_id):
+  # ?from=2026-11-01&to=2026-11-08 lists the gaps between the venue's shows
+  # from the start of the 1st to the start of the 8th
+  start, end = datetime_arg('from'), datetime_arg('to')
+  if not start < end <= start + MAX_FREE_SLOTS_RANGE:
+    abort(400, 'to must be after from, by at most %d days' % MAX_FREE_SLOTS_RANGE.days)
+  min_minutes = request.args.get('min_minutes', type=int)
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+    abort(404)
+  slots = free_slots(venue_id, start, end, timedelta(minutes=min_minutes) if min_minutes else None)
+  return jsonify({
+    "venue_id": venue_id,
+    "from": str(start),
+    "to": str(end),
+    "free_slots": [{"start": str(a), "end": str(b)} for a, b in slots]
+  })
+
+@api.route('/shows/batch', methods=['POST'])
+def create_shows():
+  # {"artist_id": 1, "duration": 120, "dates": [{"venue_id": 1, "start_time": "2026-11-01 20:00"}, ...]}
+  # books one artist at many venues, all or none; duration in minutes,
+  # 120 if left out
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict) or not isinstance(body.get('dates'), list) or not body['dates']:
+    abort(400, 'expected a JSON object with a list of dates')
+  if len(body['dates']) > MAX_TOUR_DATES:
+    abort(400, 'at most %d dates per batch' % MAX_TOUR_DATES)
+  artist_id, duration = body.get('artist_id'), body.get('duration', 120)
+  if not isinstance(duration, int) or not 1 <= duration <= 24 * 60:
+    abort(400, 'duration must be a number of minutes up to a day')
+  if not isinstance(artist_id, int) or Artist.query.get(artist_id) is None:
+    abort(400, 'no artist with id %r' % artist_id)
+
+  dates = [(d.get('venue_id'), d.get('start_time')) if isinstance(d, dict) else (None, None)
+           for d in body['dates']]
+  ids, errors = book_tour(artist_id, dates, timedelta(minutes=duration))
+  if errors:
+    return jsonify({
+      "error": 422,
+      "message": 'no shows were created, %d of %d dates have errors' % (len(errors), len(dates)),
+      "dates": [{"index": i, "error": errors[i]} for i in sorted(errors)]
+    }), 422
+  page_cache.invalidate('artist', artist_id)
+  page_cache.invalidate('venue', *set(int(venue_id) for venue_id, _ in dates))
+  return jsonify({"show_ids": ids}), 201
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(error):
+  return jsonify({"error": error.code, "message": error.description}), error.code
@@ -2,172 +2,220 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import json
-import dateutil.parser
-import babel
+import hmac
+import os
+import re
+import click
 from flask import (
+  Blueprint,
   Flask,
+  current_app,
   render_template,
   request,
   Response,
   flash,
   redirect,
-  url_for
+  url_for,
+  jsonify,
+  abort,
+  send_file,
+  stream_with_context
 )
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import FlaskForm
-from forms import *
-from datetime import datetime
-from models import app, db, Venue, Artist, Show
+from functools import lru_cache, wraps
+from datetime import timedelta
+from itertools import groupby
+from sqlalchemy.exc import IntegrityError
+from models import db, Venue, Artist, Show, Image, refresh_show_counts, geocode_venues
+from pagination import keyset_page, keyset_page_async
+from catalog import venue_page, artist_page, shows_page, venue_page_async, artist_page_async, shows_page_async
+from catalog import nearest_venues, upcoming_shows_count, NEAR_VENUES, MAX_NEAR_VENUES
+from geocoder import location
+from search import full_text_search, full_text_search_async
+from recommendations import refresh_recommendations
+from jobs import enqueue, enqueue_once, run_worker, job_stats
+from images import SIZES, FORMATS as IMAGE_FORMATS, image_store, queue_image_fetch, queue_image_fetches
+from facets import listing_filters, filter_listing, filter_form
+from scheduling import MAX_TOUR_DATES, book_tour, booking_conflicts, is_booking_conflict
+from cache import page_cache, invalidate_venue, invalidate_artist
+from api import api
+from export import EXPORTS, FORMATS, MissingDependency, export_chunks
+from pool import init_pool, pool_stats, pool_metrics
+from profiler import profiler
+from aio import async_reads
+from replicas import replica_router
+from templating import init_templates
+
+# Heavy modules that only some requests or commands need are imported
+# where they are used, so worker processes start quickly: babel and
+# dateutil (datetime filter), wtforms (forms.py, create and edit views),
+# Flask-Migrate and Alembic (flask db), importer.py and generator.py.
 
 #----------------------------------------------------------------------------#
-# App Config.
+# Blueprint.
 #----------------------------------------------------------------------------#
 
-app.config.from_object('config')
-moment = Moment(app)
-db.init_app(app)
+# The pages, admin endpoints and commands; create_app() below registers
+# them on an application.
+main = Blueprint('main', __name__, cli_group=None)
+moment = Moment()
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
-app.jinja_env.filters['datetime'] = format_datetime
+# Named formats of the datetime filter; anything else is a babel pattern.
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # compiled once per (format, locale) instead of on every call
+  import babel.dates
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+# about three years of hourly start times
+@lru_cache(maxsize=32768)
+def format_datetime(value, format='medium', locale=None):
+  # takes datetimes as the views pass them, or strings for older callers;
+  # memoized, since listings repeat the same start times
+  if isinstance(value, str):
+    import dateutil.parser
+    value = dateutil.parser.parse(value)
+  if locale is None:
+    import babel.dates
+    locale = babel.dates.LC_TIME
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+main.add_app_template_filter(format_datetime, 'datetime')
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
 def index():
   return render_template('pages/home.html')
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  
-  locations = Venue.query.all()
-  
-  unique_locations = set()
-  for l in locations:
-    unique_locations.add((l.city, l.state))
+# one keyset page of venues ordered by area, grouped as it is read; the
+# upcoming show count is the maintained counter on the venue row, brought
+# up to date by catalog.upcoming_shows_count()
+VENUES_ORDER = (Venue.city, Venue.state, Venue.name, Venue.id)
 
+def venues_query():
+  return db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    upcoming_shows_count(Venue)
+  )
+
+def venue_key(r):
+  return (r.city, r.state, r.name, r.id)
+
+def venue_areas(rows):
   data = []
-  for ul in unique_locations:
-    venues = Venue.query.filter(Venue.city==ul[0], Venue.state==ul[1])
+  for (city, state), venues in groupby(rows, key=lambda r: (r.city, r.state)):
     loc_info = {}
-    loc_info["city"] = ul[0]
-    loc_info["state"] = ul[1]
+    loc_info["city"] = city
+    loc_info["state"] = state
     loc_info["venues"] = []
-    for v in venues:
+    for v_id, v_name, _, _, num_upcoming_shows in venues:
       venue_info = {}
-      venue_info["id"] = v.id
-      venue_info["name"] = v.name
-      venue_info["num_upcoming_shows"] = Show.query.filter(Show.venue_id==v.id, Show.start_time > datetime.now()).count()
+      venue_info["id"] = v_id
+      venue_info["name"] = v_name
+      venue_info["num_upcoming_shows"] = num_upcoming_shows
       loc_info["venues"].append(venue_info)
     data.append(loc_info)
+  return data
 
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  
-  st = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike(f'%{st}%'))
-
+@main.route('/venues')
+def venues():
+  filters = listing_filters(request.args)
+  rows, next_cursor = keyset_page(
+    filter_listing(venues_query(), Venue, filters), VENUES_ORDER,
+    request.args.get('after'), current_app.config['PAGE_SIZE'], key=venue_key
+  )
+  return render_template('pages/venues.html', areas=venue_areas(rows), next_cursor=next_cursor,
+                         **filter_form(Venue, filters))
+
+def search_results(rows, count, page):
   response = {}
   response['data'] = []
-  for v in venues:
-    venue_info = {}
-    venue_info["id"] = v.id
-    venue_info["name"] = v.name
-    response["data"].append(venue_info)
-  response['count'] = venues.count()
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  for r in rows:
+    info = {}
+    info["id"] = r.id
+    info["name"] = r.name
+    response["data"].append(info)
+  response['count'] = count
+  response['page'] = page
+  response['has_next'] = page * current_app.config['PAGE_SIZE'] < count
+  return response
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/search', methods=['POST'])
+def search_venues():
+  # case-insensitive full-text search, see search.py: every word of the
+  # term matches the start of a word of the name, genres, city or state,
+  # so "Music" finds "The Musical Hop" and "Park Square Live Music & Coffee",
+  # but "usic" finds neither
+  st = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  filters = listing_filters(request.form)
+  venues, count = full_text_search(Venue, st, page, current_app.config['PAGE_SIZE'], filters)
+  return render_template('pages/search_venues.html', results=search_results(venues, count, page), search_term=st,
+                         **filter_form(Venue, filters))
+
+@main.route('/venues/near')
+def venues_near():
+  # the form asks for a city and state; lat and lon work too, see
+  # geocoder.location()
+  venues, error = [], None
+  k = min(max(request.args.get('k', NEAR_VENUES, type=int), 1), MAX_NEAR_VENUES)
+  if request.args:
+    try:
+      lat, lon = location(request.args)
+      venues = nearest_venues(lat, lon, k)
+    except ValueError as e:
+      error = str(e)
+  from forms import state_choices
+  return render_template('pages/venues_near.html', venues=venues, error=error, k=k,
+                         city=request.args.get('city', ''), state=request.args.get('state', '').upper(),
+                         state_choices=state_choices)
+
+@main.route('/venues/<int:venue_id>')
+@page_cache.cached('venue', 'venue_id')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  past_shows = db.session.query(Show, Artist).join(Artist).join(Venue).\
-    filter(Show.venue_id==venue_id, Show.start_time < datetime.now())
-
-  upcoming_shows = db.session.query(Show, Artist).join(Artist).join(Venue).\
-    filter(Show.venue_id==venue_id, Show.start_time > datetime.now())
-  
-  ps = []
-  for s, a in past_shows:
-    show_info = {}
-    show_info["artist_id"] = a.id
-    show_info["artist_name"] = a.name
-    show_info["artist_image_link"] = a.image_link
-    show_info["start_time"] = str(s.start_time)
-    ps.append(show_info)
-  
-  us = []
-  for s, a in upcoming_shows:
-    show_info = {}
-    show_info["artist_id"] = a.id
-    show_info["artist_name"] = a.name
-    show_info["artist_image_link"] = a.image_link
-    show_info["start_time"] = str(s.start_time)
-    us.append(show_info)
-  
-  venue = Venue.query.get(venue_id)
-  data = {
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": ps,
-    "past_shows_count":past_shows.count(),
-    "upcoming_shows": us,
-    "upcoming_shows_count":upcoming_shows.count()
-  }
-
+  data = venue_page(venue_id)
+  if data is None:
+    abort(404)
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
+  from forms import VenueForm
   form = VenueForm(request.form, meta={'csrf': False})
 
   error = False
@@ -178,6 +226,9 @@ def create_venue_submission():
       if venue.seeking_description:
         venue.seeking_talent = True
       db.session.add(venue)
+      queue_image_fetch(venue)
+      db.session.flush()
+      enqueue('recommend', venue_ids=[venue.id])
       db.session.commit()
     except:
       error = True
@@ -199,8 +250,9 @@ def create_venue_submission():
 #  Update Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   form = VenueForm()
   
   # TODO: populate form with values from venue with ID <venue_id>
@@ -231,11 +283,12 @@ def edit_venue(venue_id):
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
 
+  from forms import VenueForm
   form = VenueForm(request.form, meta={'csrf': False})
 
   error = False
@@ -247,6 +300,8 @@ def edit_venue_submission(venue_id):
         venue.seeking_talent = True
       else:
         venue.seeking_talent = False
+      queue_image_fetch(venue)
+      enqueue('recommend', venue_ids=[venue_id])
       db.session.commit()
     except:
       error = True
@@ -254,6 +309,7 @@ def edit_venue_submission(venue_id):
     finally:
       db.session.close()
     if not error:
+      invalidate_venue(venue_id)
       flash('Venue ' + request.form['name'] + ' was successfully edited!')
     else:
       flash('An error occurred. Venue ' + request.form['name'] + ' could not be edited.')
@@ -263,12 +319,12 @@ def edit_venue_submission(venue_id):
         message.append('|'.join(err) + ' for ' + field)
     flash('Errors: ' + ', '.join(message))
 
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Delete Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/<int:venue_id>', methods=['DELETE'])
+@main.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -285,6 +341,7 @@ def delete_venue(venue_id):
   finally:
     db.session.close()
   if not error:
+    invalidate_venue(venue_id)
     flash('Venue ' + name + ' was successfully deleted!')
   else:
     flash('An error occurred. Venue ' + name + ' could not be deleted.')
@@ -293,107 +350,71 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 
-@app.route('/artists')
-def artists():
-  # TODO: replace with real data returned from querying the database
+ARTISTS_ORDER = (Artist.name, Artist.id)
 
-  artists = Artist.query.all()
+def artist_key(a):
+  return (a.name, a.id)
 
+def artist_list(rows):
   data = []
-  for a in artists:
+  for a in rows:
     artist_info = {}
     artist_info["id"] = a.id
     artist_info["name"] = a.name
     data.append(artist_info)
+  return data
 
-  return render_template('pages/artists.html', artists=data)
+@main.route('/artists')
+def artists():
+  # TODO: replace with real data returned from querying the database
 
-@app.route('/artists/search', methods=['POST'])
+  filters = listing_filters(request.args)
+  artists, next_cursor = keyset_page(
+    filter_listing(db.session.query(Artist.id, Artist.name), Artist, filters), ARTISTS_ORDER,
+    request.args.get('after'), current_app.config['PAGE_SIZE'], key=artist_key
+  )
+  return render_template('pages/artists.html', artists=artist_list(artists), next_cursor=next_cursor,
+                         **filter_form(Artist, filters))
+
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  
+  # full-text search as for venues: "band" finds "The Wild Sax Band", and
+  # "A" finds the artists with a word starting with "a", no longer every
+  # name containing the letter
   st = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike(f'%{st}%'))
-
-  response = {}
-  response['data'] = []
-  count = 0
-  for a in artists:
-    artist_info = {}
-    artist_info["id"] = a.id
-    artist_info["name"] = a.name
-    response["data"].append(artist_info)
-    count += 1
-  response['count'] = count
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
+  page = max(request.form.get('page', 1, type=int), 1)
+  filters = listing_filters(request.form)
+  artists, count = full_text_search(Artist, st, page, current_app.config['PAGE_SIZE'], filters)
+  return render_template('pages/search_artists.html', results=search_results(artists, count, page), search_term=st,
+                         **filter_form(Artist, filters))
+
+@main.route('/artists/<int:artist_id>')
+@page_cache.cached('artist', 'artist_id')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  past_shows = db.session.query(Show, Venue).join(Venue).join(Artist).\
-    filter(Show.artist_id==artist_id, Show.start_time < datetime.now())
-
-  upcoming_shows = db.session.query(Show, Venue).join(Venue).join(Artist).\
-    filter(Show.artist_id==artist_id, Show.start_time > datetime.now())
-
-  ps = []
-  for s, v in past_shows:
-    show_info = {}
-    show_info["venue_id"] = v.id
-    show_info["venue_name"] = v.name
-    show_info["venue_image_link"] = v.image_link
-    show_info["start_time"] = str(s.start_time)
-    ps.append(show_info)
-
-  us = []
-  for s, v in upcoming_shows:
-    show_info = {}
-    show_info["venue_id"] = v.id
-    show_info["venue_name"] = v.name
-    show_info["venue_image_link"] = v.image_link
-    show_info["start_time"] = str(s.start_time)
-    us.append(show_info)
-
-  artist = Artist.query.get(artist_id)
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "genres": artist.genres,
-    "image_link": artist.image_link,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "past_shows": ps,
-    "past_shows_count":past_shows.count(),
-    "upcoming_shows": us,
-    "upcoming_shows_count":upcoming_shows.count()
-  }
-
+  data = artist_page(artist_id)
+  if data is None:
+    abort(404)
   return render_template('pages/show_artist.html', artist=data)
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
 
+  from forms import ArtistForm
   form = ArtistForm(request.form, meta={'csrf': False})
 
   error = False
@@ -404,6 +425,9 @@ def create_artist_submission():
       if artist.seeking_description:
         artist.seeking_venue = True
       db.session.add(artist)
+      queue_image_fetch(artist)
+      db.session.flush()
+      enqueue('recommend', artist_ids=[artist.id])
       db.session.commit()
     except:
       error = True
@@ -425,8 +449,9 @@ def create_artist_submission():
 #  Update Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+  from forms import ArtistForm
   form = ArtistForm()
   
   # TODO: populate form with fields from artist with ID <artist_id>
@@ -455,11 +480,12 @@ def edit_artist(artist_id):
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
 
+  from forms import ArtistForm
   form = ArtistForm(request.form, meta={'csrf': False})
 
   error = False
@@ -471,6 +497,8 @@ def edit_artist_submission(artist_id):
         artist.seeking_venue = True
       else:
         artist.seeking_venue = False
+      queue_image_fetch(artist)
+      enqueue('recommend', artist_ids=[artist_id])
       db.session.commit()
     except:
       error = True
@@ -478,6 +506,7 @@ def edit_artist_submission(artist_id):
     finally:
       db.session.close()
     if not error:
+      invalidate_artist(artist_id)
       flash('Artist ' + request.form['name'] + ' was successfully edited!')
     else:
       flash('An error occurred. Artist ' + request.form['name'] + ' could not be edited.')
@@ -487,12 +516,12 @@ def edit_artist_submission(artist_id):
         message.append('|'.join(err) + ' for ' + field)
     flash('Errors: ' + ', '.join(message))
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
 #  Delete Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+@main.route('/artists/<int:artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -509,6 +538,7 @@ def delete_artist(artist_id):
   finally:
     db.session.close()
   if not error:
+    invalidate_artist(artist_id)
     flash('Artist ' + name + ' was successfully deleted!')
   else:
     flash('An error occurred. Artist ' + name + ' could not be deleted.')
@@ -517,57 +547,135 @@ def delete_artist(artist_id):
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
 def shows():
   # displays list of shows at /shows
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
   
-  shows = Show.query.all()
+  data, next_cursor, _ = shows_page(request.args.get('after'), current_app.config['PAGE_SIZE'])
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
-  data = []
-  for s in shows:
-    show_info = {}
-    show_info["venue_id"] = s.venue_id
-    show_info["venue_name"] = s.venue.name
-    show_info["artist_id"] = s.artist_id
-    show_info["artist_name"] = s.artist.name
-    show_info["artist_image_link"] = s.artist.image_link
-    show_info["start_time"] = str(s.start_time)
-    data.append(show_info)
-
-  return render_template('pages/shows.html', shows=data)
+#  Async reads
+#  ----------------------------------------------------------------
+
+# With ASYNC_READS on (see aio.py) these take over the endpoints of the
+# sync read views above. They build the same queries and await the
+# independent ones together.
+
+async def venues_async():
+  filters = listing_filters(request.args)
+  rows, next_cursor = await keyset_page_async(
+    filter_listing(venues_query(), Venue, filters), VENUES_ORDER,
+    request.args.get('after'), current_app.config['PAGE_SIZE'], key=venue_key
+  )
+  return render_template('pages/venues.html', areas=venue_areas(rows), next_cursor=next_cursor,
+                         **filter_form(Venue, filters))
+
+async def search_venues_async():
+  st = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  filters = listing_filters(request.form)
+  venues, count = await full_text_search_async(Venue, st, page, current_app.config['PAGE_SIZE'], filters)
+  return render_template('pages/search_venues.html', results=search_results(venues, count, page), search_term=st,
+                         **filter_form(Venue, filters))
+
+@page_cache.cached('venue', 'venue_id')
+async def show_venue_async(venue_id):
+  data = await venue_page_async(venue_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_venue.html', venue=data)
+
+async def artists_async():
+  filters = listing_filters(request.args)
+  artists, next_cursor = await keyset_page_async(
+    filter_listing(db.session.query(Artist.id, Artist.name), Artist, filters), ARTISTS_ORDER,
+    request.args.get('after'), current_app.config['PAGE_SIZE'], key=artist_key
+  )
+  return render_template('pages/artists.html', artists=artist_list(artists), next_cursor=next_cursor,
+                         **filter_form(Artist, filters))
+
+async def search_artists_async():
+  st = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  filters = listing_filters(request.form)
+  artists, count = await full_text_search_async(Artist, st, page, current_app.config['PAGE_SIZE'], filters)
+  return render_template('pages/search_artists.html', results=search_results(artists, count, page), search_term=st,
+                         **filter_form(Artist, filters))
+
+@page_cache.cached('artist', 'artist_id')
+async def show_artist_async(artist_id):
+  data = await artist_page_async(artist_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=data)
+
+async def shows_async():
+  data, next_cursor, _ = await shows_page_async(request.args.get('after'), current_app.config['PAGE_SIZE'])
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+def register_async_views(app):
+  app.view_functions.update({
+    'main.venues': venues_async,
+    'main.search_venues': search_venues_async,
+    'main.show_venue': show_venue_async,
+    'main.artists': artists_async,
+    'main.search_artists': search_artists_async,
+    'main.show_artist': show_artist_async,
+    'main.shows': shows_async
+  })
 
 #  Create Show
 #  ----------------------------------------------------------------
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
+  from forms import ShowForm
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
 
+  from forms import ShowForm
   form = ShowForm(request.form, meta={'csrf': False})
   
   error = False
+  conflict = False
   if form.validate():
+    start_time = form.start_time.data
+    end_time = start_time + timedelta(minutes=form.duration.data)
+    conflicts = booking_conflicts(form.venue_id.data, form.artist_id.data, start_time, end_time)
+    if conflicts:
+      flash('Show could not be listed, it overlaps ' + ', '.join(
+        'show %d (%s to %s)' % (c.id, c.start_time, c.end_time) for c in conflicts))
+      return render_template('pages/home.html')
     try:
-      show = Show()
-      form.populate_obj(show)
+      show = Show(artist_id=form.artist_id.data, venue_id=form.venue_id.data,
+                  start_time=start_time, end_time=end_time)
       db.session.add(show)
+      enqueue('recommend', venue_ids=[show.venue_id], artist_ids=[show.artist_id])
       db.session.commit()
+    except IntegrityError as e:
+      error = True
+      # booked by a concurrent request since the check above
+      conflict = is_booking_conflict(e)
+      db.session.rollback()
     except:
       error = True
       db.session.rollback()
     finally:
       db.session.close()
     if not error:
+      page_cache.invalidate('venue', form.venue_id.data)
+      page_cache.invalidate('artist', form.artist_id.data)
       flash('Show was successfully listed!')
+    elif conflict:
+      flash('Show could not be listed, it overlaps another show.')
     else:
       flash('An error occurred. Show could not be listed.')
   else:
@@ -578,19 +686,341 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+@main.route('/shows/create-batch', methods=['GET'])
+def create_show_batch():
+  from forms import TourForm
+  form = TourForm()
+  return render_template('forms/new_tour.html', form=form, row_errors=[])
+
+@main.route('/shows/create-batch', methods=['POST'])
+def create_show_batch_submission():
+  # one artist at many venues, e.g. a tour, booked all or none
+  from forms import TourForm
+  form = TourForm(request.form, meta={'csrf': False})
+
+  row_errors = []
+  if not form.validate():
+    message = []
+    for field, err in form.errors.items():
+        message.append('|'.join(err) + ' for ' + field)
+    flash('Errors: ' + ', '.join(message))
+    return render_template('forms/new_tour.html', form=form, row_errors=row_errors)
+
+  # "venue_id, start_time" lines, numbered as the user sees them
+  lines = [(n, line) for n, line in enumerate(form.dates.data.splitlines(), 1) if line.strip()]
+  if len(lines) > MAX_TOUR_DATES:
+    flash('A batch takes at most %d shows.' % MAX_TOUR_DATES)
+  elif Artist.query.get(form.artist_id.data) is None:
+    flash('No artist with id %d.' % form.artist_id.data)
+  else:
+    dates = [(line.split(',', 1) + [''])[:2] for _, line in lines]
+    ids, errors = book_tour(form.artist_id.data, dates, timedelta(minutes=form.duration.data))
+    if not errors:
+      page_cache.invalidate('artist', form.artist_id.data)
+      page_cache.invalidate('venue', *set(int(venue_id) for venue_id, _ in dates))
+      flash('%d shows were successfully listed!' % len(ids))
+      return render_template('pages/home.html')
+    row_errors = [(lines[i][0], lines[i][1], errors[i]) for i in sorted(errors)]
+    flash('No shows were listed, %d of %d lines have errors.' % (len(errors), len(lines)))
+  return render_template('forms/new_tour.html', form=form, row_errors=row_errors)
+
+#  Images
+#  ----------------------------------------------------------------
+
+# a thumbnail's content never changes at its url, see images.py
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+@main.route('/images/<digest>/<size>.<format>')
+def image(digest, size, format):
+  if size not in SIZES or format not in IMAGE_FORMATS or not re.fullmatch('[0-9a-f]{64}', digest):
+    abort(404)
+  path = image_store.path(digest, size, format)
+  if not os.path.exists(path):
+    # the thumbnails were lost, e.g. with a temporary IMAGE_CACHE_DIR:
+    # fetch them again, once however many visitors ask meanwhile, and send
+    # the browser to the link
+    url = db.session.query(Image.url).filter(Image.digest == digest).limit(1).scalar()
+    if url is None:
+      abort(404)
+    enqueue_once('fetch-image', url=url)
+    db.session.commit()
+    response = redirect(url)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+  response = send_file(path, mimetype=IMAGE_FORMATS[format][1], etag='%s-%s-%s' % (digest, size, format),
+                       max_age=IMAGE_MAX_AGE, conditional=True)
+  response.cache_control.public = True
+  response.cache_control.immutable = True
+  return response
+
+#  Admin
+#  ----------------------------------------------------------------
+
+# Admin endpoints and /metrics answer only requests sending ADMIN_TOKEN as
+# `Authorization: Bearer <token>`, and do not exist (404) while no
+# ADMIN_TOKEN is configured, as in production unless it is set.
+
+def admin_required(view):
+  @wraps(view)
+  def checked(*args, **kwargs):
+    token = current_app.config['ADMIN_TOKEN']
+    if not token:
+      abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), ('Bearer ' + token).encode()):
+      abort(403)
+    return view(*args, **kwargs)
+  return checked
+
+@main.route('/admin/cache')
+@admin_required
+def cache_stats():
+  # hit/miss counters of the profile page cache in this process
+  stats = page_cache.stats()
+  if current_app.jinja_env.fragment_cache is not None:
+    stats["template_fragments"] = len(current_app.jinja_env.fragment_cache)
+  return jsonify(stats)
+
+@main.route('/admin/pool')
+@admin_required
+def pool_status():
+  # connection pools of this worker process
+  stats = pool_stats(db.get_engine())
+  stats["async_reads"] = async_reads.stats()
+  stats["replicas"] = replica_router.stats()
+  return jsonify(stats)
+
+@main.route('/admin/jobs')
+@admin_required
+def job_status():
+  # queue depth and latency of the last hour's jobs, see jobs.py
+  return jsonify(job_stats())
+
+@main.route('/metrics')
+@admin_required
+def metrics():
+  # Prometheus text exposition, per worker process
+  lines = profiler.prometheus() + pool_metrics(db.get_engine()) + replica_router.prometheus()
+  return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@main.route('/admin/export/<kind>.<format>')
+@admin_required
+def export_data(kind, format):
+  # streams the whole table; resume with ?after=<last exported id>
+  if kind not in EXPORTS or format not in FORMATS:
+    abort(404)
+  try:
+    chunks, mimetype = export_chunks(kind, format, after=request.args.get('after', type=int))
+  except MissingDependency as e:
+    return Response(str(e) + '\n', status=501, mimetype='text/plain')
+  response = Response(stream_with_context(chunks), mimetype=mimetype)
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+  return response
+
 #  Error Handling
 #  ----------------------------------------------------------------
 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@main.cli.command('refresh-show-counts')
+@click.option('--full', is_flag=True, help='Recompute the counters from the shows table.')
+def refresh_show_counts_command(full):
+  """Move shows that have started from upcoming to past counts."""
+  refresh_show_counts(full=full)
+
+@main.cli.command('refresh-recommendations')
+@click.option('--full', is_flag=True, help='Recompute every profile, not only those whose shows or profile changed.')
+@click.option('--batch-size', default=200, show_default=True, help='Profiles recomputed per transaction.')
+def refresh_recommendations_command(full, batch_size):
+  """Recompute the recommended artists of venues and venues of artists."""
+  counts = refresh_recommendations(
+    full=full, top_k=current_app.config['RECOMMENDATIONS_PER_PROFILE'], batch_size=batch_size
+  )
+  click.echo('%(venues)d venues, %(artists)d artists refreshed' % counts, err=True)
+
+@main.cli.command('geocode-venues')
+@click.option('--all', 'full', is_flag=True, help='Place every venue again, not only those without a location.')
+def geocode_venues_command(full):
+  """Place venues on the map from the bundled gazetteer."""
+  click.echo('%d venues placed' % geocode_venues(full=full), err=True)
+
+@main.cli.command('run-worker')
+@click.option('--threads', type=int, help='Worker threads, JOB_WORKER_THREADS by default.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def run_worker_command(threads, burst):
+  """Run background jobs until interrupted."""
+  import signal
+  import threading
+
+  app = current_app._get_current_object()
+  threads = threads or app.config['JOB_WORKER_THREADS']
+  stop = threading.Event()
+  # finish the jobs in hand on SIGTERM as on Ctrl-C
+  signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+  click.echo('Running jobs on %d threads' % threads, err=True)
+  try:
+    run_worker(app, threads, burst=burst, stop=stop)
+  except KeyboardInterrupt:
+    pass
+
+@main.cli.command('job-stats')
+@click.option('--minutes', default=60, show_default=True, help='Report jobs finished within this many minutes.')
+def job_stats_command(minutes):
+  """Show the job queue depth and the latency of recently finished jobs."""
+  stats = job_stats(timedelta(minutes=minutes))
+  click.echo('%-24s %8s %8s %8s %12s' % ('queued', 'due', 'waiting', 'running', 'oldest due'))
+  for row in stats["queue"]:
+    oldest = '%.1fs' % row["oldest_due_seconds"] if row["oldest_due_seconds"] is not None else '-'
+    click.echo('%-24s %8d %8d %8d %12s' % (row["name"], row["due"], row["waiting"], row["running"], oldest))
+  click.echo('')
+  click.echo('%-24s %8s %8s %12s %12s %12s' % ('finished, last %d min' % minutes, 'done', 'failed',
+                                               'latency p50', 'latency p95', 'run avg'))
+  for row in stats["finished"]:
+    click.echo('%-24s %8d %8d %11.2fs %11.2fs %11.2fs' % (
+      row["name"], row["done"], row["failed"],
+      row["latency_p50_seconds"], row["latency_p95_seconds"], row["run_avg_seconds"]))
+
+@main.cli.command('fetch-images')
+@click.option('--all', 'full', is_flag=True, help='Queue every image link, not only those without thumbnails.')
+def fetch_images_command(full):
+  """Queue fetching venue and artist images for the job workers."""
+  click.echo('%d image links queued' % queue_image_fetches(full=full), err=True)
+
+@main.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows validated and inserted per transaction.')
+@click.option('--rejects', type=click.File('w'), help='Write rejected rows to this file as JSON lines.')
+def import_data_command(kind, path, chunk_size, rejects):
+  """Bulk import venues, artists or shows from a CSV or JSONL file."""
+  def progress(stats):
+    click.echo('%(read)d read, %(imported)d imported, %(rejected)d rejected' % stats, err=True)
+
+  from importer import import_file
+
+  stats = import_file(kind, path, chunk_size=chunk_size, rejects=rejects, progress=progress)
+  rate = stats["imported"] / stats["seconds"] if stats["seconds"] else 0
+  click.echo('Imported %d %s in %.1fs (%.0f rows/s), rejected %d of %d rows.' % (
+    stats["imported"], kind, stats["seconds"], rate, stats["rejected"], stats["read"]))
+
+@main.cli.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'format', type=click.Choice(sorted(FORMATS)), default='csv', show_default=True)
+@click.option('--after', type=int, help='Resume after this id.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Output file, stdout by default.')
+def export_data_command(kind, format, after, output):
+  """Stream venues, artists or shows to CSV, JSONL or Parquet."""
+  try:
+    chunks, _ = export_chunks(kind, format, after=after)
+  except MissingDependency as e:
+    raise click.ClickException(str(e))
+  binary = format == 'parquet'
+  if output:
+    out = open(output, 'wb') if binary else open(output, 'w', newline='')
+  else:
+    out = click.get_binary_stream('stdout') if binary else click.get_text_stream('stdout')
+  for chunk in chunks:
+    out.write(chunk)
+  out.flush()
+
+@main.cli.command('generate-data')
+@click.option('--scale', default='small', show_default=True, help='small, medium or large, see generator.SCALES.')
+@click.option('--venues', type=int, help='Override the number of venues of the scale.')
+@click.option('--artists', type=int, help='Override the number of artists of the scale.')
+@click.option('--shows', type=int, help='Override the number of shows of the scale.')
+@click.option('--seed', default=42, show_default=True, help='Random seed; the same seed and --now give the same data.')
+@click.option('--now', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Date shows are placed around, from two years before to one after; today by default.')
+@click.confirmation_option(prompt='This deletes all venues, artists and shows. Continue?')
+def generate_data_command(scale, venues, artists, shows, seed, now):
+  """Replace the catalog with deterministic synthetic data."""
+  from generator import SCALES, generate, today
+
+  if scale not in SCALES:
+    raise click.BadParameter('choose from %s.' % ', '.join(sorted(SCALES)), param_hint='--scale')
+  counts = dict(SCALES[scale])
+  for key, value in (('venues', venues), ('artists', artists), ('shows', shows)):
+    if value is not None:
+      counts[key] = value
+
+  def progress(name, rows, seconds):
+    click.echo('%-8s %10d in %6.1fs (%.0f/s)' % (name, rows, seconds, rows / seconds if seconds else 0))
+
+  if now is None:
+    now = today()
+  # the date is part of what makes a run repeatable
+  click.echo('placing shows around %s, repeat with --seed %d --now %s' % (
+    now.date(), seed, now.date()))
+  generate(seed=seed, progress=progress, now=now, **counts)
+
+class LazyMigrate(object):
+  """Flask-Migrate's app.extensions['migrate'] entry, set up on first use.
+
+  Flask-Migrate adds `flask db` itself, and its commands are the only
+  readers of the entry, so Alembic is only imported when they run.
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  def __getattr__(self, name):
+    from flask_migrate import Migrate
+    Migrate(self.app, db)
+    return getattr(self.app.extensions['migrate'], name)
+
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+def create_app(config=None, **settings):
+  """Build the application.
+
+  config is a class or a name from config.CONFIGS, by default the
+  FYYUR_CONFIG environment variable or 'development'; settings override
+  single values, e.g. create_app('testing', SQLALCHEMY_DATABASE_URI=...).
+  """
+  from config import CONFIGS
+
+  if config is None:
+    config = os.environ.get('FYYUR_CONFIG', 'development')
+  if isinstance(config, str):
+    config = CONFIGS[config]
+
+  app = Flask(__name__)
+  app.config.from_object(config)
+  app.config.update(settings)
+  if not app.config['SECRET_KEY']:
+    # a random per-process key would sign each worker's sessions and
+    # flashes differently
+    raise RuntimeError('SECRET_KEY must be set')
+
+  moment.init_app(app)
+  init_pool(app)
+  db.init_app(app)
+  replica_router.init_app(app)
+  async_reads.init_app(app)
+  page_cache.init_app(app)
+  image_store.init_app(app)
+  profiler.init_app(app)
+  app.register_blueprint(main)
+  app.register_blueprint(api)
+  if app.config['ASYNC_READS']:
+    register_async_views(app)
+  app.extensions['migrate'] = LazyMigrate(app)
+  # after the blueprints, since compiling checks the filters they add
+  init_templates(app)
+
+  if not app.debug and not app.testing:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
@@ -600,17 +1030,19 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+  return app
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
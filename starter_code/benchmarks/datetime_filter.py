@@ -0,0 +1,93 @@
+#----------------------------------------------------------------------------#
+# Benchmark: the datetime template filter on a 10k-show /shows page.
+#
+# Renders pages/shows.html for the same shows twice: with the old filter,
+# which parsed a str() of every start time back with dateutil and let babel
+# look up the pattern and locale per call, and with format_datetime(),
+# which takes the datetimes as the views now pass them. Start times fall on
+# the hour over three years, like generator.py's. Reports the per-row cost
+# of each and fails if the two pages differ. Needs no database.
+#
+#   python -m benchmarks.datetime_filter --shows 10000
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import create_app, format_datetime
+
+# the show cards must render, not come from the fragment cache
+app = create_app(TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES=0)
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def shows(count, seed=42):
+  rng = random.Random(seed)
+  start = datetime(2026, 1, 1, 0, 0)
+  hours = 3 * 365 * 24
+  return [{
+    "venue_id": rng.randint(1, 1000),
+    "venue_name": 'Venue',
+    "artist_id": rng.randint(1, 5000),
+    "artist_name": 'Artist',
+    "artist_image_link": 'https://example.com/artist.jpg',
+    "start_time": start + timedelta(hours=rng.randrange(hours))
+  } for _ in range(count)]
+
+
+def render(data, rounds):
+  """Render the page rounds + 1 times; return it with the seconds of the
+  first render, on an empty memo cache, and of the fastest later one."""
+  format_datetime.cache_clear()
+  timings = []
+  for _ in range(rounds + 1):
+    started = time.perf_counter()
+    with app.test_request_context('/shows'):
+      page = render_template('pages/shows.html', shows=data, next_cursor=None)
+    timings.append(time.perf_counter() - started)
+  return page, timings[0], min(timings[1:])
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--shows', type=int, default=10000)
+  parser.add_argument('--rounds', type=int, default=3, help='Repeat renders per variant; the fastest counts.')
+  args = parser.parse_args()
+
+  data = shows(args.shows)
+  legacy = [dict(show, start_time=str(show["start_time"])) for show in data]
+
+  app.jinja_env.filters['datetime'] = legacy_format_datetime
+  old_page, _, old_seconds = render(legacy, args.rounds)
+  app.jinja_env.filters['datetime'] = format_datetime
+  new_page, cold_seconds, new_seconds = render(data, args.rounds)
+  # the rest of the template, for scale
+  app.jinja_env.filters['datetime'] = lambda value, format='medium': ''
+  _, _, bare_seconds = render(data, args.rounds)
+
+  print('%d shows, %d distinct start times' % (args.shows, len({s["start_time"] for s in data})))
+  print('%-14s %10s %12s' % ('filter', 'page ms', 'us per row'))
+  for name, seconds in (('old', old_seconds), ('new, cold', cold_seconds),
+                        ('new, memoized', new_seconds), ('no filter', bare_seconds)):
+    print('%-14s %10.1f %12.2f' % (name, seconds * 1000, seconds / args.shows * 1e6))
+  if old_page != new_page:
+    sys.exit('the two filters rendered different pages')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,74 @@
+#----------------------------------------------------------------------------#
+# Check: the planner can serve the profile and search queries from indexes.
+#
+# Runs EXPLAIN for the show lookups made by show_venue()/show_artist(), the
+# full-text searches, the genre/city/state listing filters and the nearest
+# venues, with sequential scans disabled so the result does
+# not depend on table size, and fails if any of them misses its index.
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench \
+#     python -m benchmarks.explain_indexes
+#----------------------------------------------------------------------------#
+
+import os
+import sys
+from datetime import datetime
+
+from app import create_app
+from models import db, Venue, Artist, Show
+from facets import filter_listing
+from search import search_matches
+
+CHECKS = [
+  ('shows by venue and start_time', 'ix_shows_venue_id_start_time',
+   lambda: db.session.query(Show.id).filter(Show.venue_id==1, Show.start_time > datetime.now())),
+  ('shows by artist and start_time', 'ix_shows_artist_id_start_time',
+   lambda: db.session.query(Show.id).filter(Show.artist_id==1, Show.start_time > datetime.now())),
+  ('venue search', 'ix_venues_search_vector',
+   lambda: search_matches(Venue, 'music')),
+  ('artist search', 'ix_artists_search_vector',
+   lambda: search_matches(Artist, 'band')),
+  ('venues by genre', 'ix_venues_genres',
+   lambda: filter_listing(db.session.query(Venue.id), Venue, {'genre': ['Jazz'], 'state': 'CA', 'seeking': 'y'})),
+  ('venues by state', 'ix_venues_state',
+   lambda: filter_listing(db.session.query(Venue.id), Venue, {'genre': ['Jazz'], 'state': 'CA', 'seeking': 'y'})),
+  ('artists by genre', 'ix_artists_genres',
+   lambda: filter_listing(db.session.query(Artist.id), Artist, {'genre': ['Jazz', 'Blues']})),
+  ('artists by city', 'ix_artists_lower_city',
+   lambda: filter_listing(db.session.query(Artist.id), Artist, {'city': 'San Francisco'})),
+  ('nearest venues', 'ix_venues_location',
+   lambda: db.session.query(Venue.id).filter(Venue.latitude.isnot(None)).
+     order_by(db.func.point(Venue.longitude, Venue.latitude).op('<->')(db.func.point(-122.42, 37.77))).limit(10)),
+]
+
+
+def explain(query):
+  statement = query.statement.compile(db.get_engine())
+  rows = db.session.connection().execute('EXPLAIN ' + str(statement), statement.params)
+  return '\n'.join(row[0] for row in rows)
+
+
+def main():
+  url = os.environ.get('BENCH_DATABASE_URL')
+  if not url:
+    sys.exit('BENCH_DATABASE_URL must point at a migrated database.')
+  app = create_app(SQLALCHEMY_DATABASE_URI=url)
+
+  failed = False
+  with app.app_context():
+    db.session.execute('SET enable_seqscan = off')
+    for name, index, query in CHECKS:
+      plan = explain(query())
+      used = index in plan
+      failed = failed or not used
+      print('%-32s %-5s %s' % (name, 'OK' if used else 'MISS', index))
+      if not used:
+        print('  ' + plan.replace('\n', '\n  '))
+    db.session.rollback()
+
+  if failed:
+    sys.exit('FAIL: some queries do not use their index')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,248 @@
+#----------------------------------------------------------------------------#
+# Benchmark: every page, search and form submission of the app.
+#
+# Seeds a synthetic dataset (see generator.py), then drives each route
+# through the Flask test client, in-process and without network access. It
+# reports p50/p95/p99 latency, throughput and SQL statements per request
+# (from the profiler's Server-Timing header).
+#
+# The write routes create, edit and delete rows: venues and artists named
+# "Bench ..." (edits rename seeded ones to "Edited ..."), and shows booked
+# after the last seeded one, so they never conflict. Deletes remove the
+# venues and artists created before them. A write counts only when the app
+# flashed "successfully".
+#
+# --save writes the results as a JSON baseline; --baseline compares against
+# one and fails when a route's p95 grows past --threshold times the baseline
+# or it sends more statements than before. A missing baseline is reported
+# and skipped; `fab baseline` writes one.
+#
+# The database must be migrated (flask db upgrade), is wiped on seeding and
+# is written to by the write routes: point it at a throwaway database.
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench \
+#     python -m benchmarks.routes --scale small --save benchmarks/baseline.json
+#----------------------------------------------------------------------------#
+
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import create_app
+from generator import SCALES, generate, today
+from models import db, Artist, Show, Venue
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# flashed by every write route that went through
+SUCCESS = 'successfully'
+
+
+def created(app, model):
+  """Path factory for the rows of model created by the benchmark, oldest
+  first; looked up on first use, after the create route ran."""
+  ids = []
+  def next_id():
+    if not ids:
+      with app.app_context():
+        ids.extend(row.id for row in model.query.filter(model.name.like('Bench %')).order_by(model.id.desc()))
+    if not ids:
+      raise RuntimeError('no %s created by the benchmark left to delete' % model.__tablename__)
+    return ids.pop()
+  return next_id
+
+
+def routes(app, venues, artists, after, rng):
+  """(name, method, path or path factory, form data or data factory,
+  success marker or None) for every route; shows are booked after the
+  datetime after."""
+  venue_id = lambda: rng.randint(1, venues)
+  artist_id = lambda: rng.randint(1, artists)
+  venue = lambda: '/venues/%d' % venue_id()
+  artist = lambda: '/artists/%d' % artist_id()
+  # one free hour a day per request, for both venue and artist
+  slots = (after + timedelta(days=n) for n in itertools.count(1))
+  slot = lambda: next(slots).strftime('%Y-%m-%d %H:%M:%S')
+  counter = itertools.count(1)
+  profile = lambda name, kind, **fields: dict({
+    "name": '%s %s %d' % (name, kind, next(counter)),
+    "city": 'Denver',
+    "state": 'CO',
+    "phone": '303-555-0100',
+    "genres": ['Jazz', 'Blues'],
+    "website": 'https://example.com/',
+    "seeking_description": 'Looking for a %s' % ('band' if kind == 'venue' else 'stage'),
+  }, **fields)
+  venue_form = lambda name: lambda: profile(name, 'venue', address='1 Main St')
+  artist_form = lambda name: lambda: profile(name, 'artist')
+  show_form = lambda: {"venue_id": venue_id(), "artist_id": artist_id(), "start_time": slot(), "duration": 60}
+  tour_form = lambda: {"artist_id": artist_id(), "duration": 60,
+                       "dates": '\n'.join('%d, %s' % (venue_id(), slot()) for _ in range(3))}
+  return [
+    ('index', 'GET', '/', None, None),
+    ('venues', 'GET', '/venues', None, None),
+    ('venues_filtered', 'GET', '/venues?genre=Jazz&state=CA&seeking=y', None, None),
+    ('venues_near', 'GET', '/venues/near?city=Denver&state=CO', None, None),
+    ('show_venue', 'GET', venue, None, None),
+    ('search_venues', 'POST', '/venues/search', {"search_term": 'venue 1'}, None),
+    ('edit_venue', 'GET', lambda: venue() + '/edit', None, None),
+    ('create_venue_form', 'GET', '/venues/create', None, None),
+    ('artists', 'GET', '/artists', None, None),
+    ('artists_filtered', 'GET', '/artists?genre=Jazz&genre=Blues&state=NY', None, None),
+    ('show_artist', 'GET', artist, None, None),
+    ('search_artists', 'POST', '/artists/search', {"search_term": 'artist 1'}, None),
+    ('edit_artist', 'GET', lambda: artist() + '/edit', None, None),
+    ('create_artist_form', 'GET', '/artists/create', None, None),
+    ('shows', 'GET', '/shows', None, None),
+    ('create_shows', 'GET', '/shows/create', None, None),
+    ('create_show_batch_form', 'GET', '/shows/create-batch', None, None),
+    ('api_venue', 'GET', lambda: '/api/v1' + venue(), None, None),
+    ('api_artist', 'GET', lambda: '/api/v1' + artist(), None, None),
+    ('api_shows', 'GET', '/api/v1/shows', None, None),
+    ('api_venues_near', 'GET', '/api/v1/venues/near?lat=39.74&lon=-104.99&k=10', None, None),
+    ('create_venue', 'POST', '/venues/create', venue_form('Bench'), SUCCESS),
+    ('edit_venue_submission', 'POST', lambda: venue() + '/edit', venue_form('Edited'), SUCCESS),
+    ('create_artist', 'POST', '/artists/create', artist_form('Bench'), SUCCESS),
+    ('edit_artist_submission', 'POST', lambda: artist() + '/edit', artist_form('Edited'), SUCCESS),
+    ('create_show', 'POST', '/shows/create', show_form, SUCCESS),
+    ('create_show_batch', 'POST', '/shows/create-batch', tour_form, SUCCESS),
+    ('delete_venue', 'DELETE', lambda next_id=created(app, Venue): '/venues/%d' % next_id(), None, SUCCESS),
+    ('delete_artist', 'DELETE', lambda next_id=created(app, Artist): '/artists/%d' % next_id(), None, SUCCESS),
+  ]
+
+
+def percentile(samples, p):
+  ordered = sorted(samples)
+  return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def flashed(client, response):
+  """The messages flashed by a request: on its page, or kept in the session
+  for the page a redirect leads to."""
+  if response.status_code == 200:
+    return response.get_data(as_text=True)
+  with client.session_transaction() as session:
+    return ' '.join(message for _, message in session.pop('_flashes', []))
+
+
+def run_route(client, method, path, data, success, requests, warmup):
+  latencies = []
+  queries = []
+  for i in range(warmup + requests):
+    url = path() if callable(path) else path
+    form = data() if callable(data) else data
+    start = time.perf_counter()
+    response = client.open(url, method=method, data=form)
+    elapsed = time.perf_counter() - start
+    # the edit forms redirect to the profile
+    if response.status_code not in ((200, 302) if success else (200,)):
+      raise RuntimeError('%s %s returned %d' % (method, url, response.status_code))
+    if success and success not in flashed(client, response):
+      raise RuntimeError('%s %s did not go through: %s' % (method, url, form))
+    if i < warmup:
+      continue
+    latencies.append(elapsed)
+    match = QUERIES.search(response.headers.get('Server-Timing', ''))
+    queries.append(int(match.group(1)) if match else 0)
+  return {
+    "requests": requests,
+    "p50_ms": percentile(latencies, 50) * 1000,
+    "p95_ms": percentile(latencies, 95) * 1000,
+    "p99_ms": percentile(latencies, 99) * 1000,
+    "throughput_rps": requests / sum(latencies),
+    "queries_per_request": max(queries)
+  }
+
+
+def compare(results, baseline, threshold):
+  failures = []
+  for name, result in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if result["p95_ms"] > before["p95_ms"] * threshold:
+      failures.append('%s: p95 %.1f ms > %.1f ms baseline x %.2f' % (
+        name, result["p95_ms"], before["p95_ms"], threshold))
+    if result["queries_per_request"] > before["queries_per_request"]:
+      failures.append('%s: %d queries per request, baseline %d' % (
+        name, result["queries_per_request"], before["queries_per_request"]))
+  return failures
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+  parser.add_argument('--venues', type=int)
+  parser.add_argument('--artists', type=int)
+  parser.add_argument('--shows', type=int)
+  parser.add_argument('--now', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                      help='Date the seeded shows are placed around, today by default.')
+  parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+  parser.add_argument('--requests', type=int, default=50, help='Measured requests per route.')
+  parser.add_argument('--warmup', type=int, default=5)
+  parser.add_argument('--route', action='append', help='Only run these routes.')
+  parser.add_argument('--cache', action='store_true', help='Keep the profile page cache enabled.')
+  parser.add_argument('--save', help='Write the results to this JSON baseline.')
+  parser.add_argument('--baseline', help='Fail on regressions against this JSON baseline.')
+  parser.add_argument('--threshold', type=float, default=1.25)
+  args = parser.parse_args()
+
+  url = os.environ.get('BENCH_DATABASE_URL')
+  if not url:
+    sys.exit('BENCH_DATABASE_URL must point at a scratch database.')
+  # keep the profiler's Server-Timing header, drop its logging
+  app = create_app(SQLALCHEMY_DATABASE_URI=url,
+                   PROFILER_LOG_REQUESTS=False,
+                   PROFILER_SLOW_QUERY_MS=float('inf'),
+                   PAGE_CACHE_BACKEND='memory' if args.cache else 'none')
+
+  scale = dict(SCALES[args.scale])
+  for key in scale:
+    if getattr(args, key):
+      scale[key] = getattr(args, key)
+
+  with app.app_context():
+    if not args.no_seed:
+      start = time.perf_counter()
+      now = args.now or today()
+      generate(now=now, **scale)
+      print('seeded %(venues)d venues, %(artists)d artists, %(shows)d shows' % scale,
+            'around %s in %.1fs' % (now.date(), time.perf_counter() - start))
+    after = db.session.query(db.func.max(Show.end_time)).scalar() or datetime.now()
+
+  # no app context is held around the requests: each one gets its own, and
+  # with it a fresh session, as in a server
+  results = {}
+  client = app.test_client()
+  rng = random.Random(42)
+  print('%-24s %9s %9s %9s %10s %8s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries'))
+  for name, method, path, data, success in routes(app, scale["venues"], scale["artists"], after, rng):
+    if args.route and name not in args.route:
+      continue
+    result = results[name] = run_route(client, method, path, data, success, args.requests, args.warmup)
+    print('%-24s %9.2f %9.2f %9.2f %10.1f %8d' % (
+      name, result["p50_ms"], result["p95_ms"], result["p99_ms"],
+      result["throughput_rps"], result["queries_per_request"]))
+
+  report = {"scale": scale, "routes": results}
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  if args.baseline and not os.path.exists(args.baseline):
+    print('no baseline at %s, nothing to compare against; write one with --save' % args.baseline)
+  elif args.baseline:
+    with open(args.baseline) as f:
+      failures = compare(results, json.load(f)["routes"], args.threshold)
+    if failures:
+      sys.exit('FAIL:\n  ' + '\n  '.join(failures))
+    print('OK: no route regressed past the baseline')
+
+
+if __name__ == '__main__':
+  main()
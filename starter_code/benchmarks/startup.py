@@ -0,0 +1,74 @@
+#----------------------------------------------------------------------------#
+# Benchmark: process startup.
+#
+# Starts fresh interpreters that import app.py and build the application
+# with create_app(), as a new worker or a `flask` command does, and reports
+# the fastest import and create_app() times. With --importtime it also lists
+# the imports of app.py that took longest, with everything they import in
+# turn (python -X importtime). Needs no database.
+#
+#   FYYUR_CONFIG=production python -m benchmarks.startup --runs 5
+#----------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(SECRET_KEY='bench')
+created = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported}))
+'''
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def probe(importtime=False):
+  command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+  result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+  return json.loads(result.stdout.splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, count):
+  """app.py's own imports by cumulative microseconds."""
+  modules = []
+  for line in stderr.splitlines():
+    match = IMPORTTIME.match(line)
+    if match and len(match.group(3)) == 3:
+      modules.append((int(match.group(2)), match.group(4)))
+  return sorted(modules, reverse=True)[:count]
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--runs', type=int, default=5, help='Fresh processes; the fastest counts.')
+  parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                      help='Also list the N slowest imports of app.py.')
+  args = parser.parse_args()
+
+  timings = [probe()[0] for _ in range(args.runs)]
+  print('config %s' % os.environ.get('FYYUR_CONFIG', 'development'))
+  print('%-12s %10s' % ('', 'ms'))
+  for step in ('import', 'create_app'):
+    print('%-12s %10.1f' % (step, min(t[step] for t in timings) * 1000))
+  print('%-12s %10.1f' % ('total', min(t["import"] + t["create_app"] for t in timings) * 1000))
+
+  if args.importtime:
+    _, stderr = probe(importtime=True)
+    print()
+    print('%-40s %10s' % ('module', 'ms'))
+    for micros, module in slowest_imports(stderr, args.importtime):
+      print('%-40s %10.1f' % (module, micros / 1000.0))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Benchmark: template compilation and rendering.
+#
+# Cold start: compiles every template in a fresh environment without a
+# bytecode cache, with an empty filesystem bytecode cache, and with a warm
+# one, as a new worker process would at startup.
+#
+# Per render: renders the home page with auto-reload on and off, then the
+# venue, artist and shows pages for synthetic data with the show card
+# fragment cache off and warm, and fails if the output differs. Needs no
+# database.
+#
+#   python -m benchmarks.templates --shows 1000
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+
+from app import create_app
+from cache import MemoryBackend
+from templating import FragmentCacheExtension, precompile_templates
+
+app = create_app()
+
+
+def fresh_environment(bytecode_cache=None):
+  env = app.create_jinja_environment()
+  env.filters.update(app.jinja_env.filters)
+  env.add_extension(FragmentCacheExtension)
+  env.bytecode_cache = bytecode_cache
+  return env
+
+
+def cold_start():
+  directory = tempfile.mkdtemp(prefix='fyyur-jinja-bench-')
+  try:
+    results = []
+    for name, cache in (('no bytecode cache', None),
+                        ('bytecode cache, empty', FileSystemBytecodeCache(directory)),
+                        ('bytecode cache, warm', FileSystemBytecodeCache(directory))):
+      timings = precompile_templates(fresh_environment(cache))
+      results.append((name, len(timings), sum(timings.values())))
+    return results
+  finally:
+    shutil.rmtree(directory)
+
+
+def shows(count, seed=42):
+  rng = random.Random(seed)
+  start = datetime(2026, 1, 1, 0, 0)
+  data = []
+  for i in range(count):
+    data.append({
+      "venue_id": rng.randint(1, 1000),
+      "venue_name": 'Venue %d' % i,
+      "venue_image_link": 'https://example.com/venue.jpg',
+      "artist_id": rng.randint(1, 5000),
+      "artist_name": 'Artist %d' % i,
+      "artist_image_link": 'https://example.com/artist.jpg',
+      "start_time": start + timedelta(hours=rng.randrange(3 * 365 * 24))
+    })
+  return data
+
+
+def profile(kind, data):
+  half = len(data) // 2
+  return {
+    "id": 1, "name": 'The %s' % kind, "genres": ['Jazz', 'Folk'], "address": '1 Main St',
+    "city": 'San Francisco', "state": 'CA', "phone": '123-123-1234', "website": None,
+    "facebook_link": None, "seeking_talent": False, "seeking_venue": False,
+    "seeking_description": None, "image_link": None,
+    "past_shows": data[:half], "past_shows_count": half,
+    "upcoming_shows": data[half:], "upcoming_shows_count": len(data) - half
+  }
+
+
+def render(template, rounds, **context):
+  timings = []
+  for _ in range(rounds):
+    started = time.perf_counter()
+    with app.test_request_context('/'):
+      page = render_template(template, **context)
+    timings.append(time.perf_counter() - started)
+  return page, min(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--shows', type=int, default=1000, help='Show cards per page.')
+  parser.add_argument('--rounds', type=int, default=5, help='Renders per variant; the fastest counts.')
+  args = parser.parse_args()
+
+  print('%-24s %10s %10s' % ('cold start', 'templates', 'ms'))
+  for name, count, seconds in cold_start():
+    print('%-24s %10d %10.1f' % (name, count, seconds * 1000))
+  print()
+
+  env = app.jinja_env
+  auto_reload = env.auto_reload
+  print('%-24s %10s' % ('home page', 'ms'))
+  try:
+    for setting in (True, False):
+      env.auto_reload = setting
+      _, seconds = render('pages/home.html', args.rounds * 20)
+      print('%-24s %10.3f' % ('auto-reload %s' % ('on' if setting else 'off'), seconds * 1000))
+  finally:
+    env.auto_reload = auto_reload
+  print()
+
+  data = shows(args.shows)
+  pages = [
+    ('show_venue', 'pages/show_venue.html', {"venue": profile('venue', data)}),
+    ('show_artist', 'pages/show_artist.html', {"artist": profile('artist', data)}),
+    ('shows', 'pages/shows.html', {"shows": data, "next_cursor": None})
+  ]
+  fragment_cache = env.fragment_cache
+  print('%-12s %18s %18s' % ('render', 'no fragments ms', 'fragments ms'))
+  failed = False
+  try:
+    for name, template, context in pages:
+      env.fragment_cache = None
+      plain, plain_seconds = render(template, args.rounds, **context)
+      env.fragment_cache = MemoryBackend(2 * args.shows)
+      render(template, 1, **context)
+      cached, cached_seconds = render(template, args.rounds, **context)
+      print('%-12s %18.1f %18.1f' % (name, plain_seconds * 1000, cached_seconds * 1000))
+      failed = failed or plain != cached
+  finally:
+    env.fragment_cache = fragment_cache
+  if failed:
+    sys.exit('fragment caching changed the rendered output')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,100 @@
+#----------------------------------------------------------------------------#
+# Benchmark: /venues issues a constant number of queries.
+#
+# Seeds an increasing number of venues (spread over a handful of areas, each
+# with past and upcoming shows) and counts the statements the /venues view
+# sends to the database. The count must not grow with the number of venues.
+#
+# The benchmark wipes the tables it seeds, so it only runs against the
+# database given in BENCH_DATABASE_URL:
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench \
+#     python -m benchmarks.venues_query_count
+#----------------------------------------------------------------------------#
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, Venue, Artist, Show, refresh_show_counts
+
+SCALES = (10, 100, 1000, 5000)
+AREAS = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA')]
+
+
+def seed(num_venues):
+  db.session.execute('TRUNCATE shows, venue_recommendations, artist_recommendations, venues, artists RESTART IDENTITY')
+  db.session.bulk_insert_mappings(Artist, [{
+    "name": 'Bench Artist',
+    "city": 'San Francisco',
+    "state": 'CA',
+    "seeking_venue": False
+  }])
+  db.session.bulk_insert_mappings(Venue, [{
+    "name": 'Bench Venue %d' % i,
+    "city": AREAS[i % len(AREAS)][0],
+    "state": AREAS[i % len(AREAS)][1],
+    "address": '%d Bench St' % i,
+    "phone": '000-000-0000',
+    "seeking_talent": False
+  } for i in range(num_venues)])
+  now = datetime.now()
+  # an hour apart, the artist plays one show at a time
+  starts = [now + timedelta(days=(30 if i % 2 else -30), hours=i) for i in range(num_venues)]
+  db.session.bulk_insert_mappings(Show, [{
+    "artist_id": 1,
+    "venue_id": i + 1,
+    "start_time": start,
+    "end_time": start + timedelta(hours=1)
+  } for i, start in enumerate(starts)])
+  db.session.commit()
+  # bulk inserts bypass the show counter hooks
+  refresh_show_counts(full=True)
+
+
+def count_queries(client, path):
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  engine = db.get_engine()
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    start = time.perf_counter()
+    response = client.get(path)
+    elapsed = time.perf_counter() - start
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+  assert response.status_code == 200, response.status_code
+  return len(statements), elapsed
+
+
+def main():
+  url = os.environ.get('BENCH_DATABASE_URL')
+  if not url:
+    sys.exit('BENCH_DATABASE_URL must point at a scratch database.')
+  app = create_app(SQLALCHEMY_DATABASE_URI=url)
+
+  results = []
+  with app.app_context():
+    client = app.test_client()
+    for num_venues in SCALES:
+      seed(num_venues)
+      # warm up the connection pool and template cache
+      client.get('/venues')
+      queries, elapsed = count_queries(client, '/venues')
+      results.append((num_venues, queries, elapsed))
+      print('%6d venues: %3d queries, %8.2f ms' % (num_venues, queries, elapsed * 1000))
+
+  if len(set(queries for _, queries, _ in results)) != 1:
+    sys.exit('FAIL: /venues query count grows with the number of venues')
+  print('OK: /venues query count is constant')
+
+
+if __name__ == '__main__':
+  main()
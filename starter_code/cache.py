@@ -0,0 +1,203 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import Response, current_app, g, session
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class MemoryBackend(object):
+  """Per-process LRU cache with a per-entry TTL."""
+
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at = entry
+      if expires_at < time.monotonic():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = (value, time.monotonic() + ttl)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete(self, *keys):
+    with self._lock:
+      for key in keys:
+        self._entries.pop(key, None)
+
+  def __len__(self):
+    return len(self._entries)
+
+class RedisBackend(object):
+  """Shared cache on any client with the redis-py get/setex/delete calls,
+  e.g. redis.Redis or a local stand-in such as fakeredis."""
+
+  def __init__(self, client, prefix='fyyur:page:'):
+    self.client = client
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return value.decode() if isinstance(value, bytes) else value
+
+  def set(self, key, value, ttl):
+    self.client.setex(self.prefix + key, ttl, value)
+
+  def delete(self, *keys):
+    if keys:
+      self.client.delete(*[self.prefix + key for key in keys])
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+class _PageCacheState(object):
+  """An app's backend, settings and counters."""
+
+  def __init__(self, backend, ttl, replica_hold):
+    self.backend = backend
+    self.ttl = ttl
+    self.replica_hold = replica_hold
+    self.hits = 0
+    self.misses = 0
+
+class PageCache(object):
+  """Caches rendered pages keyed by entity, e.g. 'venue:1'.
+
+  Configured from PAGE_CACHE_BACKEND ('memory', 'redis' or 'none'),
+  PAGE_CACHE_MAX_ENTRIES, PAGE_CACHE_TTL and PAGE_CACHE_REDIS_URL, or with
+  an explicit backend passed to init_app(). Each app keeps its own backend
+  and counters in app.extensions['page_cache'].
+
+  A page rendered on a read replica may predate a write the primary has
+  already committed, so for a while after an invalidation pages read from
+  a replica are served but not stored; see replicas.py.
+  """
+
+  def __init__(self, app=None, backend=None):
+    if app is not None:
+      self.init_app(app, backend)
+
+  def init_app(self, app, backend=None):
+    replica_hold = 0
+    if app.config.get('SQLALCHEMY_BINDS'):
+      replica_hold = int(math.ceil(app.config['DB_REPLICA_MAX_LAG_SECONDS'] + app.config['DB_REPLICA_CHECK_SECONDS']))
+    if backend is None:
+      kind = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+      if kind == 'memory':
+        backend = MemoryBackend(app.config.get('PAGE_CACHE_MAX_ENTRIES', 1024))
+      elif kind == 'redis':
+        import redis
+        backend = RedisBackend(redis.Redis.from_url(app.config['PAGE_CACHE_REDIS_URL']))
+      elif kind != 'none':
+        raise ValueError('Unknown PAGE_CACHE_BACKEND %r' % kind)
+    app.extensions['page_cache'] = _PageCacheState(backend, app.config.get('PAGE_CACHE_TTL', 300), replica_hold)
+
+  @property
+  def backend(self):
+    return current_app.extensions['page_cache'].backend
+
+  def cached(self, kind, id_arg):
+    """Serve the decorated view from the cache, keyed by kind and the
+    id_arg view argument. Requests with pending flash messages bypass the
+    cache, since the layout renders them into the page."""
+    def lookup(kwargs):
+      # (key, cached response); no key when the cache is bypassed
+      state = current_app.extensions['page_cache']
+      if state.backend is None or '_flashes' in session:
+        return None, None
+      key = '%s:%s' % (kind, kwargs[id_arg])
+      body = state.backend.get(key)
+      if body is not None:
+        state.hits += 1
+        return key, Response(body, mimetype='text/html')
+      state.misses += 1
+      return key, None
+
+    def store(key, body):
+      state = current_app.extensions['page_cache']
+      if key is not None and isinstance(body, str):
+        if not (g.get('db_replica') and state.backend.get('hold:' + key)):
+          state.backend.set(key, body, state.ttl)
+      return body
+
+    def decorator(view):
+      if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+          key, response = lookup(kwargs)
+          if response is not None:
+            return response
+          return store(key, await view(*args, **kwargs))
+        return async_wrapper
+
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        key, response = lookup(kwargs)
+        if response is not None:
+          return response
+        return store(key, view(*args, **kwargs))
+      return wrapper
+    return decorator
+
+  def invalidate(self, kind, *ids):
+    state = current_app.extensions['page_cache']
+    if state.backend is not None:
+      keys = ['%s:%s' % (kind, i) for i in ids]
+      state.backend.delete(*keys)
+      if state.replica_hold:
+        for key in keys:
+          state.backend.set('hold:' + key, '1', state.replica_hold)
+
+  def stats(self):
+    state = current_app.extensions['page_cache']
+    lookups = state.hits + state.misses
+    stats = {
+      "backend": type(state.backend).__name__ if state.backend else None,
+      "hits": state.hits,
+      "misses": state.misses,
+      "hit_ratio": float(state.hits) / lookups if lookups else None,
+      "ttl": state.ttl
+    }
+    if isinstance(state.backend, MemoryBackend):
+      stats["entries"] = len(state.backend)
+      stats["max_entries"] = state.backend.max_entries
+    return stats
+
+page_cache = PageCache()
+
+#----------------------------------------------------------------------------#
+# Profile pages.
+#----------------------------------------------------------------------------#
+
+# A venue page lists its shows' artists and an artist page its shows'
+# venues, so changing one side also invalidates the pages on the other.
+
+def invalidate_venue(venue_id):
+  artist_ids = [a for a, in db.session.query(Show.artist_id).filter(Show.venue_id==venue_id).distinct()]
+  page_cache.invalidate('venue', venue_id)
+  page_cache.invalidate('artist', *artist_ids)
+
+def invalidate_artist(artist_id):
+  venue_ids = [v for v, in db.session.query(Show.venue_id).filter(Show.artist_id==artist_id).distinct()]
+  page_cache.invalidate('artist', artist_id)
+  page_cache.invalidate('venue', *venue_ids)
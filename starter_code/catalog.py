@@ -0,0 +1,327 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Venue, Artist, Show
+from pagination import keyset_page, keyset_page_async
+from aio import async_reads
+from recommendations import recommended_artists, recommended_venues
+from geocoder import distance_km, degree_radius
+
+#----------------------------------------------------------------------------#
+# Page data.
+#----------------------------------------------------------------------------#
+
+# The data behind the venue, artist and shows pages, shared by the HTML
+# views in app.py and the JSON API in api.py.
+
+def profile_query(model, entity_id):
+  """The columns of one venue or artist row, for drivers that do not load
+  ORM instances; search_vector is left out as on the ORM side."""
+  columns = [c for c in model.__table__.c if c.key != 'search_vector']
+  return db.session.query(*columns).filter(model.id==entity_id)
+
+# Past and upcoming shows are split at the row's show_counts_as_of, the
+# cut-off of its maintained counters, unless that is more than
+# SHOW_COUNTS_MAX_AGE_SECONDS old: then `flask refresh-show-counts` has not
+# run for a while, or has had nothing to move for this row, and the split
+# is made at the current time instead, so a show never stays upcoming long
+# after it started. The counts on profile pages are those of the lists; the
+# listings correct the counter by the shows started between
+# show_counts_as_of and the same cut-off (upcoming_shows_count()).
+
+def show_cutoff(as_of):
+  now = datetime.now()
+  max_age = timedelta(seconds=current_app.config['SHOW_COUNTS_MAX_AGE_SECONDS'])
+  return as_of if as_of >= now - max_age else now
+
+def show_cutoff_clause(model):
+  """show_cutoff() of model's rows, in SQL."""
+  now = datetime.now()
+  max_age = timedelta(seconds=current_app.config['SHOW_COUNTS_MAX_AGE_SECONDS'])
+  return db.case([(model.show_counts_as_of >= now - max_age, model.show_counts_as_of)], else_=now)
+
+def split_shows(query, model, entity_id):
+  """Split a shows query into its past and upcoming halves, as show_cutoff()
+  does in Python."""
+  as_of = db.session.query(show_cutoff_clause(model)).filter(model.id==entity_id).as_scalar()
+  return query.filter(Show.start_time <= as_of), query.filter(Show.start_time > as_of)
+
+def upcoming_shows_count(model):
+  """The upcoming show count of model's rows as of show_cutoff(): the
+  counter less the shows that started since it was last refreshed, which
+  the (venue_id/artist_id, start_time) index finds without reading the
+  row's other shows."""
+  fk = Show.venue_id if model is Venue else Show.artist_id
+  started = db.select([db.func.count(Show.id)]).where(db.and_(
+    fk == model.id, Show.start_time > model.show_counts_as_of, Show.start_time <= show_cutoff_clause(model)
+  )).as_scalar()
+  return (model.upcoming_shows_count - started).label('upcoming_shows_count')
+
+def venue_shows(venue_id):
+  return db.session.query(Show.start_time, Artist.id, Artist.name, Artist.image_link, Artist.image_digest).\
+    join(Artist).filter(Show.venue_id==venue_id).order_by(Show.start_time)
+
+def venue_show_info(row):
+  start_time, a_id, a_name, a_image_link, a_image_digest = row
+  show_info = {}
+  show_info["artist_id"] = a_id
+  show_info["artist_name"] = a_name
+  show_info["artist_image_link"] = a_image_link
+  show_info["artist_image_digest"] = a_image_digest
+  show_info["start_time"] = start_time
+  return show_info
+
+def recommendation_info(row):
+  entity_id, name, image_link, image_digest, score = row
+  info = {}
+  info["id"] = entity_id
+  info["name"] = name
+  info["image_link"] = image_link
+  info["image_digest"] = image_digest
+  info["score"] = round(score, 3)
+  return info
+
+def venue_data(venue, ps, us, recommended):
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "latitude": venue.latitude,
+    "longitude": venue.longitude,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "image_digest": venue.image_digest,
+    "past_shows": ps,
+    "past_shows_count": len(ps),
+    "upcoming_shows": us,
+    "upcoming_shows_count": len(us),
+    # recommendations are only kept for venues seeking talent
+    "recommended_artists": [recommendation_info(r) for r in recommended] if venue.seeking_talent else []
+  }
+
+def venue_page(venue_id):
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return None
+
+  # a single query for all of the venue's shows, split as in split_shows()
+  cutoff = show_cutoff(venue.show_counts_as_of)
+  ps = []
+  us = []
+  for row in venue_shows(venue_id):
+    if row.start_time > cutoff:
+      us.append(venue_show_info(row))
+    else:
+      ps.append(venue_show_info(row))
+  return venue_data(venue, ps, us, recommended_artists(venue_id) if venue.seeking_talent else [])
+
+def artist_shows(artist_id):
+  return db.session.query(Show.start_time, Venue.id, Venue.name, Venue.image_link, Venue.image_digest).\
+    join(Venue).filter(Show.artist_id==artist_id).order_by(Show.start_time)
+
+def artist_show_info(row):
+  start_time, v_id, v_name, v_image_link, v_image_digest = row
+  show_info = {}
+  show_info["venue_id"] = v_id
+  show_info["venue_name"] = v_name
+  show_info["venue_image_link"] = v_image_link
+  show_info["venue_image_digest"] = v_image_digest
+  show_info["start_time"] = start_time
+  return show_info
+
+def artist_data(artist, ps, us, recommended):
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "genres": artist.genres,
+    "image_link": artist.image_link,
+    "image_digest": artist.image_digest,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "past_shows": ps,
+    "past_shows_count": len(ps),
+    "upcoming_shows": us,
+    "upcoming_shows_count": len(us),
+    "recommended_venues": [recommendation_info(r) for r in recommended] if artist.seeking_venue else []
+  }
+
+def artist_page(artist_id):
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return None
+
+  # see venue_page()
+  cutoff = show_cutoff(artist.show_counts_as_of)
+  ps = []
+  us = []
+  for row in artist_shows(artist_id):
+    if row.start_time > cutoff:
+      us.append(artist_show_info(row))
+    else:
+      ps.append(artist_show_info(row))
+  return artist_data(artist, ps, us, recommended_venues(artist_id) if artist.seeking_venue else [])
+
+# Keyset order of the shows listing.
+SHOWS_ORDER = (Show.start_time, Show.id)
+
+def shows_query():
+  # venue and artist columns come from the same statement, one keyset page
+  # at a time, instead of lazy-loading s.venue and s.artist per show
+  return db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Artist.image_digest.label('artist_image_digest'),
+    db.func.greatest(Show.updated_at, Venue.updated_at, Artist.updated_at).label('updated_at')
+  ).join(Venue).join(Artist)
+
+def shows_data(shows, next_cursor):
+  """The page data and version string of one page of shows_query() rows."""
+  data = []
+  for s in shows:
+    show_info = {}
+    show_info["venue_id"] = s.venue_id
+    show_info["venue_name"] = s.venue_name
+    show_info["artist_id"] = s.artist_id
+    show_info["artist_name"] = s.artist_name
+    show_info["artist_image_link"] = s.artist_image_link
+    show_info["artist_image_digest"] = s.artist_image_digest
+    show_info["start_time"] = s.start_time
+    data.append(show_info)
+
+  version = fingerprint(next_cursor, [(s.id, s.updated_at) for s in shows])
+  return data, version
+
+def shows_page(after, page_size):
+  """Return one keyset page of shows, the next page's cursor and a version
+  string that changes whenever any row on the page does."""
+  shows, next_cursor = keyset_page(
+    shows_query(), SHOWS_ORDER, after, page_size,
+    key=lambda s: (s.start_time, s.id)
+  )
+  data, version = shows_data(shows, next_cursor)
+  return data, next_cursor, version
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+# ix_venues_location is a GiST index on point(longitude, latitude), which
+# hands out venues nearest first on that plane (the <-> order) by walking
+# down the tree, however many venues there are. Plane distance is not
+# distance on the Earth, a degree of longitude shrinks away from the
+# equator, so a few more venues than asked for are read in plane order and
+# ranked by great-circle distance. The ranking is final once the last venue
+# read is farther on the plane than any venue within the k-th distance can
+# be (geocoder.degree_radius()); until then the read is repeated four times
+# longer. Venues across the antimeridian from the point are seen as far.
+
+# venues /venues/near lists unless asked for another number, and at most
+NEAR_VENUES = 10
+MAX_NEAR_VENUES = 100
+
+def nearby_venue_info(row, distance):
+  info = {}
+  info["id"] = row.id
+  info["name"] = row.name
+  info["city"] = row.city
+  info["state"] = row.state
+  info["latitude"] = row.latitude
+  info["longitude"] = row.longitude
+  info["distance_km"] = round(distance, 1)
+  info["upcoming_shows_count"] = row.upcoming_shows_count
+  return info
+
+def nearest_venues(lat, lon, k):
+  """The k venues nearest to (lat, lon), nearest first, with their
+  distance and upcoming show count."""
+  plane_distance = db.func.point(Venue.longitude, Venue.latitude).op('<->')(db.func.point(lon, lat))
+  query = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+    upcoming_shows_count(Venue), plane_distance.label('plane_distance')
+  ).filter(Venue.latitude.isnot(None)).order_by(plane_distance)
+  limit = max(2 * k, 16)
+  while True:
+    rows = query.limit(limit).all()
+    ranked = sorted(((distance_km(lat, lon, r.latitude, r.longitude), r.id, r) for r in rows), key=lambda d: d[:2])[:k]
+    if len(rows) < limit or len(ranked) == k and rows[-1].plane_distance > degree_radius(lat, ranked[-1][0]):
+      return [nearby_venue_info(r, distance) for distance, _, r in ranked]
+    limit *= 4
+
+#----------------------------------------------------------------------------#
+# Async page data.
+#----------------------------------------------------------------------------#
+
+# The same pages on the async driver (see aio.py). The profile row, its
+# past and upcoming shows and its recommendations are independent queries
+# and run concurrently.
+
+async def venue_page_async(venue_id):
+  venues, past, upcoming, recommended = await async_reads.fetch_all(
+    profile_query(Venue, venue_id), *split_shows(venue_shows(venue_id), Venue, venue_id),
+    recommended_artists(venue_id))
+  if not venues:
+    return None
+  return venue_data(venues[0], [venue_show_info(r) for r in past], [venue_show_info(r) for r in upcoming], recommended)
+
+async def artist_page_async(artist_id):
+  artists, past, upcoming, recommended = await async_reads.fetch_all(
+    profile_query(Artist, artist_id), *split_shows(artist_shows(artist_id), Artist, artist_id),
+    recommended_venues(artist_id))
+  if not artists:
+    return None
+  return artist_data(artists[0], [artist_show_info(r) for r in past], [artist_show_info(r) for r in upcoming], recommended)
+
+async def shows_page_async(after, page_size):
+  shows, next_cursor = await keyset_page_async(
+    shows_query(), SHOWS_ORDER, after, page_size,
+    key=lambda s: (s.start_time, s.id)
+  )
+  data, version = shows_data(shows, next_cursor)
+  return data, next_cursor, version
+
+#----------------------------------------------------------------------------#
+# Versions.
+#----------------------------------------------------------------------------#
+
+# Cheap validators for the venue and artist pages: one aggregate over the
+# row versions the page is built from, without loading the page itself.
+# Adding or removing a show bumps the venue and artist rows through the
+# show counter hooks, and so does moving shows from upcoming to past; the
+# number of shows started so far covers a split made at the current time
+# (see show_cutoff()).
+
+def fingerprint(*parts):
+  return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def venue_version(venue_id):
+  row = db.session.query(Venue.updated_at, db.func.max(Artist.updated_at), db.func.count(Show.id),
+                         db.func.count(Show.id).filter(Show.start_time <= datetime.now())).\
+    outerjoin(Show, Show.venue_id==Venue.id).outerjoin(Artist, Artist.id==Show.artist_id).\
+    filter(Venue.id==venue_id).group_by(Venue.id).first()
+  return fingerprint('venue', venue_id, *row) if row else None
+
+def artist_version(artist_id):
+  row = db.session.query(Artist.updated_at, db.func.max(Venue.updated_at), db.func.count(Show.id),
+                         db.func.count(Show.id).filter(Show.start_time <= datetime.now())).\
+    outerjoin(Show, Show.artist_id==Artist.id).outerjoin(Venue, Venue.id==Show.venue_id).\
+    filter(Artist.id==artist_id).group_by(Artist.id).first()
+  return fingerprint('artist', artist_id, *row) if row else None
@@ -1,14 +1,152 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+def env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
 
-# Connect to the database
+def database_url(name, default):
+    # SQLAlchemy no longer accepts the postgres:// scheme some hosts hand out
+    url = os.environ.get(name, default)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
 
+# create_app() picks one of the classes below by name from FYYUR_CONFIG
+# ('development' unless set). Every setting can be overridden from the
+# environment.
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://postgres@localhost:5432/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+class Config(object):
+    """Production settings, and the defaults of the other environments."""
+
+    DEBUG = False
+    TESTING = False
+
+    # Signs sessions and flashes; must be the same in every worker.
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    # Bearer token of the /admin endpoints; they are disabled while unset.
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool, per worker process (see pool.py).
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+    # Per-statement timeout in milliseconds, 0 disables it.
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    # Connect through PgBouncer in transaction pooling mode: no startup
+    # options and no session state, only per-transaction settings.
+    DB_PGBOUNCER = env_flag('DB_PGBOUNCER', False)
+
+    # Read replicas: DB_REPLICA_URIS is a comma separated list of database URIs,
+    # each becomes a replica_<n> bind. GET requests are spread over them by
+    # DB_REPLICA_POLICY ('round_robin' or 'least_connections'); a replica more
+    # than DB_REPLICA_MAX_LAG_SECONDS behind, checked every
+    # DB_REPLICA_CHECK_SECONDS, is taken out of rotation (see replicas.py).
+    DB_REPLICA_URIS = [uri for uri in os.environ.get('DB_REPLICA_URIS', '').split(',') if uri]
+    SQLALCHEMY_BINDS = {'replica_%d' % i: uri for i, uri in enumerate(DB_REPLICA_URIS)}
+    DB_REPLICA_POLICY = os.environ.get('DB_REPLICA_POLICY', 'round_robin')
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5))
+    DB_REPLICA_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_CHECK_SECONDS', 1))
+
+    # Serve the read views as async views on asyncpg (see aio.py).
+    ASYNC_READS = env_flag('ASYNC_READS', False)
+
+    # Rows per page on the keyset-paginated /venues, /artists and /shows listings.
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+
+    # Profile pages split shows into past and upcoming at the last
+    # `flask refresh-show-counts`, or at the current time once that is
+    # older than this (see catalog.split_shows()).
+    SHOW_COUNTS_MAX_AGE_SECONDS = int(os.environ.get('SHOW_COUNTS_MAX_AGE_SECONDS', 900))
+
+    # Rendered venue/artist profile page cache: 'memory' (per-process LRU),
+    # 'redis' (shared, needs the redis package) or 'none'.
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1024))
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Templates are compiled at startup, their bytecode is kept in
+    # TEMPLATE_BYTECODE_CACHE_DIR ('filesystem') for the next process, and
+    # the filesystem is not checked for changes (see templating.py). Unset,
+    # the bytecode goes to Jinja's private per-user directory.
+    TEMPLATES_AUTO_RELOAD = env_flag('TEMPLATES_AUTO_RELOAD', False)
+    TEMPLATE_PRECOMPILE = env_flag('TEMPLATE_PRECOMPILE', True)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'filesystem')
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    # Rendered {% cache %} fragments such as show cards, per process; 0 disables.
+    TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES', 20000))
+    TEMPLATE_FRAGMENT_CACHE_TTL = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_TTL', 3600))
+
+    # Artists recommended on a venue's page and venues on an artist's, as
+    # precomputed by `flask refresh-recommendations` (see recommendations.py).
+    RECOMMENDATIONS_PER_PROFILE = int(os.environ.get('RECOMMENDATIONS_PER_PROFILE', 6))
+
+    # Background jobs (see jobs.py): worker threads per `flask run-worker`,
+    # seconds an idle worker waits before polling again, seconds a claimed
+    # job is leased to its worker before another may take it over, first
+    # retry delay (doubling per attempt, up to JOB_MAX_BACKOFF_SECONDS) and
+    # hours finished jobs are kept for job-stats.
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+    JOB_MAX_BACKOFF_SECONDS = float(os.environ.get('JOB_MAX_BACKOFF_SECONDS', 3600))
+    JOB_RETENTION_HOURS = int(os.environ.get('JOB_RETENTION_HOURS', 24))
+
+    # Image thumbnails (see images.py): where they are stored, shared by all
+    # web processes and workers, and how image links are fetched. Links to
+    # private addresses are refused unless IMAGE_FETCH_ALLOW_PRIVATE. Unset,
+    # thumbnails are stored in the app's instance folder, under images/.
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR')
+    IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 10))
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    IMAGE_FETCH_ALLOW_PRIVATE = env_flag('IMAGE_FETCH_ALLOW_PRIVATE', False)
+
+    # Request profiler: statements slower than this are logged with their plan.
+    PROFILER_SLOW_QUERY_MS = int(os.environ.get('PROFILER_SLOW_QUERY_MS', 100))
+    PROFILER_EXPLAIN_SLOW_QUERIES = env_flag('PROFILER_EXPLAIN_SLOW_QUERIES', True)
+    PROFILER_LOG_REQUESTS = env_flag('PROFILER_LOG_REQUESTS', True)
+
+class ProductionConfig(Config):
+    pass
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev')
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', 'dev')
+
+    # Templates compile on first use and reload when edited.
+    TEMPLATES_AUTO_RELOAD = env_flag('TEMPLATES_AUTO_RELOAD', True)
+    TEMPLATE_PRECOMPILE = env_flag('TEMPLATE_PRECOMPILE', False)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'none')
+
+class TestingConfig(DevelopmentConfig):
+    DEBUG = False
+    TESTING = True
+    SECRET_KEY = 'test'
+    ADMIN_TOKEN = 'test'
+    SQLALCHEMY_DATABASE_URI = database_url('TEST_DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur_test')
+    WTF_CSRF_ENABLED = False
+
+    # Every request sees the database as it is.
+    PAGE_CACHE_BACKEND = 'none'
+    TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES = 0
+    PROFILER_LOG_REQUESTS = False
+
+    # image links may point at a local fixture server
+    IMAGE_FETCH_ALLOW_PRIVATE = env_flag('IMAGE_FETCH_ALLOW_PRIVATE', True)
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig
+}
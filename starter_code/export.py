@@ -0,0 +1,149 @@
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Streaming export.
+#----------------------------------------------------------------------------#
+
+# Rows are read in id order through a server-side cursor (yield_per), so
+# memory stays flat however large the table is, and encoded one batch at a
+# time. An interrupted export resumes with after=<last exported id>.
+
+EXPORTS = {
+  'venues': (Venue, ('id', 'name', 'city', 'state', 'address', 'latitude', 'longitude', 'phone', 'image_link',
+                     'facebook_link', 'website', 'genres', 'seeking_talent', 'seeking_description',
+                     'upcoming_shows_count', 'past_shows_count', 'updated_at')),
+  'artists': (Artist, ('id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                       'website', 'genres', 'seeking_venue', 'seeking_description',
+                       'upcoming_shows_count', 'past_shows_count', 'updated_at')),
+  'shows': (Show, ('id', 'artist_id', 'venue_id', 'start_time', 'end_time', 'updated_at'))
+}
+
+def export_batches(kind, after=None, batch_size=1000):
+  """Yield lists of row tuples of kind, in id order, after the given id."""
+  model, columns = EXPORTS[kind]
+  query = db.session.query(*[getattr(model, c) for c in columns]).order_by(model.id)
+  if after is not None:
+    query = query.filter(model.id > after)
+  rows = iter(query.yield_per(batch_size))
+  while True:
+    batch = list(islice(rows, batch_size))
+    if not batch:
+      break
+    yield batch
+
+def _value(value):
+  # '2026-11-01 20:00:00', the form import-data reads back
+  return value.isoformat(' ') if isinstance(value, datetime) else value
+
+def csv_chunks(kind, batches):
+  columns = EXPORTS[kind][1]
+  buf = io.StringIO()
+  writer = csv.writer(buf)
+  writer.writerow(columns)
+  for batch in batches:
+    for row in batch:
+      # genres in the comma separated form import-data reads
+      writer.writerow([','.join(v) if isinstance(v, list) else _value(v) for v in row])
+    yield buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+  if buf.tell():
+    yield buf.getvalue()
+
+def jsonl_chunks(kind, batches):
+  columns = EXPORTS[kind][1]
+  for batch in batches:
+    yield ''.join(json.dumps(dict(zip(columns, map(_value, row)))) + '\n' for row in batch)
+
+class _StreamSink(object):
+  """Write-only file object handing out what was written since last read."""
+
+  def __init__(self):
+    self.closed = False
+    self._chunks = []
+    self._position = 0
+
+  def write(self, data):
+    self._chunks.append(bytes(data))
+    self._position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self._position
+
+  def flush(self):
+    pass
+
+  def close(self):
+    self.closed = True
+
+  def read_written(self):
+    data = b''.join(self._chunks)
+    self._chunks = []
+    return data
+
+def parquet_schema(kind):
+  import pyarrow
+
+  model, columns = EXPORTS[kind]
+  fields = []
+  for name in columns:
+    column_type = getattr(model, name).type
+    if isinstance(column_type, db.ARRAY):
+      arrow_type = pyarrow.list_(pyarrow.string())
+    elif isinstance(column_type, db.Boolean):
+      arrow_type = pyarrow.bool_()
+    elif isinstance(column_type, db.Integer):
+      arrow_type = pyarrow.int64()
+    elif isinstance(column_type, db.Float):
+      arrow_type = pyarrow.float64()
+    elif isinstance(column_type, db.DateTime):
+      arrow_type = pyarrow.timestamp('us')
+    else:
+      arrow_type = pyarrow.string()
+    fields.append(pyarrow.field(name, arrow_type))
+  return pyarrow.schema(fields)
+
+def parquet_chunks(kind, batches):
+  # optional dependency, only needed for columnar exports
+  import pyarrow
+  import pyarrow.parquet
+
+  schema = parquet_schema(kind)
+  sink = _StreamSink()
+  writer = pyarrow.parquet.ParquetWriter(sink, schema)
+  for batch in batches:
+    # one row group per batch
+    writer.write_table(pyarrow.Table.from_arrays(
+      [pyarrow.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)],
+      schema=schema
+    ))
+    yield sink.read_written()
+  writer.close()
+  yield sink.read_written()
+
+FORMATS = {
+  'csv': (csv_chunks, 'text/csv'),
+  'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+  'parquet': (parquet_chunks, 'application/vnd.apache.parquet')
+}
+
+class MissingDependency(RuntimeError):
+  pass
+
+def export_chunks(kind, format, after=None, batch_size=1000):
+  """Return the encoded chunks of an export and their mimetype. Raises
+  MissingDependency, before anything is streamed, when the format needs a
+  package that is not installed."""
+  if format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+    raise MissingDependency('Parquet exports need the pyarrow package (pip install pyarrow), '
+                            'which is not installed; use csv or jsonl instead.')
+  encode, mimetype = FORMATS[format]
+  return encode(kind, export_batches(kind, after, batch_size)), mimetype
@@ -6,13 +6,22 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
+        # route benchmarks against the committed baseline, needs
+        # BENCH_DATABASE_URL pointing at a scratch database
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m benchmarks.routes --baseline benchmarks/baseline.json",
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def baseline():
+    # record the route benchmarks that `fab test` compares against; run it
+    # on the commit to compare with, then commit benchmarks/baseline.json
+    local("python -m benchmarks.routes --save benchmarks/baseline.json")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
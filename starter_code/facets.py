@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Listing filters.
+#----------------------------------------------------------------------------#
+
+# The venue and artist listings and searches narrow down by genre, city,
+# state and whether the venue/artist is seeking an artist/venue, in any
+# combination, within the same statement as the page itself. genres has a
+# GIN index and state and lower(city) btree indexes (see migration
+# f3b07c9d4e16), which Postgres ANDs together as bitmaps, so "jazz venues in
+# CA" reads only the matching rows. seeking_* is true for about a third of
+# the rows and is checked on those.
+
+@lru_cache(maxsize=None)
+def genre_names():
+  """Genre choices by their lower case names."""
+  # forms.py imports wtforms, which app.py leaves to the requests needing it
+  from forms import genres_choices
+  return dict((genre.lower(), genre) for genre, _ in genres_choices)
+
+def seeking_column(model):
+  return Venue.seeking_talent if model is Venue else Artist.seeking_venue
+
+def filter_form(model, filters):
+  """Template context of the filter form, pages/filters.html."""
+  from forms import genres_choices, state_choices
+  return {
+    "filters": filters,
+    "genre_choices": genres_choices,
+    "state_choices": state_choices,
+    "seeking_label": 'Seeking talent' if model is Venue else 'Seeking venues'
+  }
+
+def listing_filters(values):
+  """The filters of a listing or search request as url parameters, to carry
+  over to its next page: genre (a list, all of which must match), city,
+  state and seeking. Empty ones are left out."""
+  filters = {}
+  # spelled as in the genre choices, whatever the case in the url
+  genres = [genre_names().get(g.strip().lower(), g.strip()) for g in values.getlist('genre') if g.strip()]
+  if genres:
+    filters['genre'] = genres
+  city = values.get('city', '').strip()
+  if city:
+    filters['city'] = city
+  state = values.get('state', '').strip().upper()
+  if state:
+    filters['state'] = state
+  if values.get('seeking'):
+    filters['seeking'] = 'y'
+  return filters
+
+def filter_listing(query, model, filters):
+  """Narrow a venue or artist query down to the rows matching filters."""
+  if 'genre' in filters:
+    # bound as varchar(120)[] like the column, else the GIN index is skipped
+    query = query.filter(model.genres.op('@>')(db.literal(filters['genre'], model.genres.type)))
+  if 'city' in filters:
+    query = query.filter(db.func.lower(model.city) == filters['city'].lower())
+  if 'state' in filters:
+    query = query.filter(model.state == filters['state'])
+  if 'seeking' in filters:
+    query = query.filter(seeking_column(model).is_(True))
+  return query
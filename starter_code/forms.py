@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, IntegerField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, optional
+from wtforms import StringField, IntegerField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, optional
 
 state_choices = [
     ('AL', 'AL'),
@@ -91,6 +91,23 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        # minutes
+        'duration', validators=[NumberRange(min=1, max=24 * 60)], default=120
+    )
+
+class TourForm(FlaskForm):
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
+    )
+    duration = IntegerField(
+        # minutes, of every show
+        'duration', validators=[NumberRange(min=1, max=24 * 60)], default=120
+    )
+    dates = TextAreaField(
+        # one "venue_id, start_time" per line
+        'dates', validators=[DataRequired()]
+    )
 
 class VenueForm(FlaskForm):
     name = StringField(
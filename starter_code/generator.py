@@ -0,0 +1,236 @@
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.schema import AddConstraint, DropConstraint
+
+from forms import state_choices, genres_choices
+from geocoder import geocode
+from models import db, Venue, Artist, Show, refresh_show_counts
+
+#----------------------------------------------------------------------------#
+# Synthetic data generator.
+#----------------------------------------------------------------------------#
+
+# Generates a catalog with realistic shapes for scale testing: venues and
+# artists spread over real cities of every state in state_choices, genres
+# from genres_choices, and shows drawn from power-law (Zipf) weights so a
+# few venues and artists carry most of the bookings, over the two years
+# before `now` and the one after. Shows last an hour, and a venue or artist
+# whose slot is taken is drawn again, so nobody is double-booked. `now` is
+# the start of today unless given, so there are always upcoming shows; the
+# same seed and `now` always produce the same rows.
+# Rows are streamed to Postgres with COPY in chunks.
+
+CITIES = {
+  'AL': ['Birmingham', 'Montgomery', 'Mobile'], 'AK': ['Anchorage', 'Fairbanks', 'Juneau'],
+  'AZ': ['Phoenix', 'Tucson', 'Flagstaff'], 'AR': ['Little Rock', 'Fayetteville', 'Fort Smith'],
+  'CA': ['Los Angeles', 'San Francisco', 'San Diego', 'Oakland', 'Sacramento'],
+  'CO': ['Denver', 'Boulder', 'Colorado Springs'], 'CT': ['Hartford', 'New Haven', 'Stamford'],
+  'DE': ['Wilmington', 'Dover', 'Newark'], 'DC': ['Washington'],
+  'FL': ['Miami', 'Orlando', 'Tampa', 'Jacksonville'], 'GA': ['Atlanta', 'Savannah', 'Athens'],
+  'HI': ['Honolulu', 'Hilo'], 'ID': ['Boise', 'Idaho Falls'], 'IL': ['Chicago', 'Springfield', 'Peoria'],
+  'IN': ['Indianapolis', 'Bloomington', 'Fort Wayne'], 'IA': ['Des Moines', 'Iowa City', 'Cedar Rapids'],
+  'KS': ['Wichita', 'Kansas City', 'Lawrence'], 'KY': ['Louisville', 'Lexington'],
+  'LA': ['New Orleans', 'Baton Rouge', 'Lafayette'], 'ME': ['Portland', 'Bangor'],
+  'MD': ['Baltimore', 'Annapolis'], 'MA': ['Boston', 'Cambridge', 'Worcester'],
+  'MI': ['Detroit', 'Ann Arbor', 'Grand Rapids'], 'MN': ['Minneapolis', 'Saint Paul', 'Duluth'],
+  'MS': ['Jackson', 'Oxford'], 'MO': ['St. Louis', 'Kansas City', 'Columbia'],
+  'MT': ['Missoula', 'Bozeman', 'Billings'], 'NE': ['Omaha', 'Lincoln'],
+  'NV': ['Las Vegas', 'Reno'], 'NH': ['Manchester', 'Portsmouth'], 'NJ': ['Newark', 'Jersey City', 'Asbury Park'],
+  'NM': ['Albuquerque', 'Santa Fe'], 'NY': ['New York', 'Brooklyn', 'Buffalo', 'Rochester'],
+  'NC': ['Charlotte', 'Raleigh', 'Asheville'], 'ND': ['Fargo', 'Bismarck'],
+  'OH': ['Columbus', 'Cleveland', 'Cincinnati'], 'OK': ['Oklahoma City', 'Tulsa'],
+  'OR': ['Portland', 'Eugene', 'Bend'], 'PA': ['Philadelphia', 'Pittsburgh'],
+  'RI': ['Providence', 'Newport'], 'SC': ['Charleston', 'Columbia'], 'SD': ['Sioux Falls', 'Rapid City'],
+  'TN': ['Nashville', 'Memphis', 'Knoxville'], 'TX': ['Austin', 'Houston', 'Dallas', 'San Antonio'],
+  'UT': ['Salt Lake City', 'Provo'], 'VT': ['Burlington', 'Montpelier'],
+  'VA': ['Richmond', 'Norfolk', 'Charlottesville'], 'WA': ['Seattle', 'Spokane', 'Tacoma'],
+  'WV': ['Charleston', 'Morgantown'], 'WI': ['Milwaukee', 'Madison'], 'WY': ['Cheyenne', 'Jackson'],
+}
+
+ADJECTIVES = ['Blue', 'Velvet', 'Golden', 'Electric', 'Rusty', 'Silver', 'Midnight', 'Crimson',
+              'Lucky', 'Wild', 'Quiet', 'Neon', 'Copper', 'Hollow', 'Brass', 'Little']
+NOUNS = ['Room', 'Hall', 'Lounge', 'Tavern', 'Theatre', 'Cellar', 'Garden', 'Barn',
+         'Ballroom', 'Saloon', 'Club', 'Den', 'Yard', 'Stage', 'Works', 'House']
+FIRST_NAMES = ['Ada', 'Ben', 'Cleo', 'Dev', 'Eva', 'Finn', 'Gus', 'Hana', 'Ike', 'June',
+               'Kai', 'Lena', 'Milo', 'Nina', 'Otto', 'Pia', 'Rosa', 'Sam', 'Tess', 'Wes']
+LAST_NAMES = ['Alvarez', 'Brooks', 'Chen', 'Diaz', 'Ellis', 'Fox', 'Grant', 'Hayes', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Moore', 'Nash', 'Okafor', 'Park', 'Reyes', 'Stone', 'Tran', 'Vega']
+BAND_NOUNS = ['Sax Band', 'Collective', 'Quartet', 'Trio', 'Orchestra', 'Brothers', 'Sisters',
+              'Machine', 'Project', 'Club', 'Ensemble', 'Revival']
+
+SCALES = {
+  'small': {"venues": 1000, "artists": 5000, "shows": 50000},
+  'medium': {"venues": 10000, "artists": 100000, "shows": 1000000},
+  'large': {"venues": 10000, "artists": 100000, "shows": 5000000}
+}
+
+VENUE_COLUMNS = ('name', 'city', 'state', 'address', 'phone', 'website', 'facebook_link',
+                 'genres', 'seeking_talent', 'seeking_description', 'latitude', 'longitude')
+ARTIST_COLUMNS = ('name', 'city', 'state', 'phone', 'website', 'facebook_link',
+                  'genres', 'seeking_venue', 'seeking_description')
+SHOW_COLUMNS = ('artist_id', 'venue_id', 'start_time', 'end_time')
+
+def _pg_array(values):
+  return '{%s}' % ','.join('"%s"' % v.replace('\\', '\\\\').replace('"', '\\"') for v in values)
+
+def _location(rng):
+  state = rng.choice(state_choices)[0]
+  return rng.choice(CITIES[state]), state
+
+def _phone(rng):
+  return '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999))
+
+def _genres(rng):
+  return _pg_array(rng.sample([g for g, _ in genres_choices], rng.randint(1, 3)))
+
+def _slug(name):
+  return ''.join(c for c in name.lower() if c.isalnum())
+
+def venue_rows(rng, count):
+  for i in range(1, count + 1):
+    name = 'The %s %s %d' % (rng.choice(ADJECTIVES), rng.choice(NOUNS), i)
+    city, state = _location(rng)
+    seeking = rng.random() < 0.3
+    # every city in CITIES is in the gazetteer
+    latitude, longitude = geocode(city, state)
+    yield (name, city, state, '%d %s St' % (rng.randint(1, 9999), rng.choice(LAST_NAMES)), _phone(rng),
+           'https://www.%s.com' % _slug(name), 'https://www.facebook.com/%s' % _slug(name),
+           _genres(rng), seeking, 'Looking for local acts, get in touch.' if seeking else '',
+           latitude, longitude)
+
+def artist_rows(rng, count):
+  for i in range(1, count + 1):
+    if rng.random() < 0.5:
+      name = '%s %s %d' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), i)
+    else:
+      name = 'The %s %s %d' % (rng.choice(ADJECTIVES), rng.choice(BAND_NOUNS), i)
+    city, state = _location(rng)
+    seeking = rng.random() < 0.4
+    yield (name, city, state, _phone(rng), 'https://www.%s.com' % _slug(name),
+           'https://www.facebook.com/%s' % _slug(name), _genres(rng),
+           seeking, 'Looking for shows in the area!' if seeking else '')
+
+def zipf_cum_weights(count, exponent):
+  total = 0.0
+  cum_weights = []
+  for rank in range(1, count + 1):
+    total += rank ** -exponent
+    cum_weights.append(total)
+  return cum_weights
+
+def show_rows(rng, count, venues, artists, now, exponent=1.1, chunk_size=50000):
+  # a shuffled id per rank, so popularity does not simply follow insert order
+  venue_ids = list(range(1, venues + 1))
+  artist_ids = list(range(1, artists + 1))
+  rng.shuffle(venue_ids)
+  rng.shuffle(artist_ids)
+  venue_weights = zipf_cum_weights(venues, exponent)
+  artist_weights = zipf_cum_weights(artists, exponent)
+  # shows fill hour slots, formatted once per hour rather than per row
+  start = now.replace(minute=0, second=0, microsecond=0) - timedelta(days=730)
+  hours = 3 * 365 * 24
+  times = [str(start + timedelta(hours=h)) for h in range(hours + 1)]
+  # slots taken, as id * hours + hour
+  venue_booked = set()
+  artist_booked = set()
+
+  remaining = count
+  while remaining:
+    n = min(chunk_size, remaining)
+    remaining -= n
+    v = rng.choices(venue_ids, cum_weights=venue_weights, k=n)
+    a = rng.choices(artist_ids, cum_weights=artist_weights, k=n)
+    t = rng.choices(range(hours), k=n)
+    for venue_id, artist_id, hour in zip(v, a, t):
+      # a fully booked head venue or artist must not be drawn forever, so
+      # all three are drawn again
+      while venue_id * hours + hour in venue_booked or artist_id * hours + hour in artist_booked:
+        venue_id = rng.choices(venue_ids, cum_weights=venue_weights)[0]
+        artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+        hour = rng.randrange(hours)
+      venue_booked.add(venue_id * hours + hour)
+      artist_booked.add(artist_id * hours + hour)
+      yield artist_id, venue_id, times[hour], times[hour + 1]
+
+def copy_rows(model, columns, rows, chunk_size=50000):
+  """COPY rows into model's table chunk by chunk and return the row count."""
+  cursor = db.session.connection().connection.cursor()
+  sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (model.__tablename__, ', '.join(columns))
+  total = 0
+  buf = io.StringIO()
+  writer = csv.writer(buf)
+  for i, row in enumerate(rows, 1):
+    writer.writerow(row)
+    if i % chunk_size == 0:
+      buf.seek(0)
+      cursor.copy_expert(sql, buf)
+      buf.seek(0)
+      buf.truncate()
+    total = i
+  if buf.tell():
+    buf.seek(0)
+    cursor.copy_expert(sql, buf)
+  return total
+
+def today():
+  """The default `now` shows are placed around: the start of today."""
+  return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def generate(venues, artists, shows, seed=42, progress=None, now=None):
+  """Replace the catalog with generated rows, placing shows around now
+  (today by default), and return {table: (rows, seconds)}."""
+  if now is None:
+    now = today()
+  rng = random.Random(seed)
+  timings = {}
+  engine = db.session.get_bind()
+  db.session.execute('TRUNCATE shows, venue_recommendations, artist_recommendations, venues, artists RESTART IDENTITY')
+  db.session.commit()
+  # loading into unindexed tables and indexing afterwards is much faster
+  # than maintaining every index row by row, the exclusion constraints'
+  # GiST indexes included
+  indexes = [ix for model in (Venue, Artist, Show) for ix in model.__table__.indexes]
+  exclusions = [c for c in Show.__table__.constraints if isinstance(c, ExcludeConstraint)]
+  for index in indexes:
+    index.drop(engine)
+  for constraint in exclusions:
+    engine.execute(DropConstraint(constraint))
+
+  try:
+    for name, model, columns, rows in (
+      ('venues', Venue, VENUE_COLUMNS, venue_rows(rng, venues)),
+      ('artists', Artist, ARTIST_COLUMNS, artist_rows(rng, artists)),
+      ('shows', Show, SHOW_COLUMNS, show_rows(rng, shows, venues, artists, now)),
+    ):
+      started = time.perf_counter()
+      count = copy_rows(model, columns, rows)
+      db.session.commit()
+      timings[name] = (count, time.perf_counter() - started)
+      if progress is not None:
+        progress(name, *timings[name])
+  finally:
+    db.session.rollback()
+    started = time.perf_counter()
+    for index in indexes:
+      index.create(engine)
+    for constraint in exclusions:
+      engine.execute(AddConstraint(constraint))
+  timings['indexes'] = (len(indexes) + len(exclusions), time.perf_counter() - started)
+  if progress is not None:
+    progress('indexes', *timings['indexes'])
+
+  # COPY bypasses the show counter hooks
+  started = time.perf_counter()
+  refresh_show_counts(full=True)
+  for table in ('venues', 'artists', 'shows'):
+    db.session.execute('ANALYZE %s' % table)
+  db.session.commit()
+  timings['counters'] = (venues + artists, time.perf_counter() - started)
+  if progress is not None:
+    progress('counters', *timings['counters'])
+  return timings
@@ -0,0 +1,78 @@
+import csv
+import math
+import os
+from functools import lru_cache
+
+#----------------------------------------------------------------------------#
+# Offline geocoding.
+#----------------------------------------------------------------------------#
+
+# Venues are placed by city and state against data/gazetteer.csv, a bundled
+# list of city centres, so geocoding never leaves the process. A city missing
+# from the gazetteer falls back to the geographic centre of its state (the
+# rows with an empty city); an unknown state has no location. Positions are
+# city-level, which is as precise as the venue forms get.
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+
+# mean Earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+def city_key(city):
+  """Spelling-insensitive city name: 'St. Louis', 'saint louis' and
+  'ST LOUIS' are the same city."""
+  words = city.lower().replace('.', ' ').split()
+  return ' '.join('st' if word == 'saint' else word for word in words)
+
+@lru_cache(maxsize=None)
+def gazetteer():
+  """(latitude, longitude) by (state, city_key(city)), '' for the state."""
+  with open(GAZETTEER, newline='') as f:
+    return dict(((row['state'], city_key(row['city'])), (float(row['latitude']), float(row['longitude'])))
+                for row in csv.DictReader(f))
+
+def geocode(city, state):
+  """The (latitude, longitude) of a city, of its state if the city is not
+  in the gazetteer, or None."""
+  places = gazetteer()
+  state = (state or '').strip().upper()
+  return places.get((state, city_key(city or ''))) or places.get((state, ''))
+
+def distance_km(lat1, lon1, lat2, lon2):
+  """Great-circle distance (haversine)."""
+  phi1, phi2 = math.radians(lat1), math.radians(lat2)
+  a = math.sin((phi2 - phi1) / 2) ** 2 + \
+    math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def degree_radius(lat, km):
+  """An upper bound, in degrees on the (longitude, latitude) plane, of how
+  far from (lat, _) a point within km of it can be. The plane stretches
+  longitude by 1 / cos(latitude), so a circle on the sphere is within a
+  box of dlat by dlon degrees around the centre."""
+  delta = km / EARTH_RADIUS_KM
+  if delta >= math.pi / 2 - math.radians(abs(lat)):
+    # the circle reaches over a pole
+    return math.hypot(math.degrees(delta), 360.0)
+  dlon = math.asin(min(1.0, math.sin(delta) / math.cos(math.radians(lat))))
+  return math.hypot(math.degrees(delta), math.degrees(dlon))
+
+def location(values):
+  """The (latitude, longitude) asked for by request arguments: lat and lon,
+  or a city and state to geocode. Raises ValueError saying what is wrong."""
+  lat, lon = values.get('lat', '').strip(), values.get('lon', '').strip()
+  if lat or lon:
+    try:
+      lat, lon = float(lat), float(lon)
+    except ValueError:
+      raise ValueError('lat and lon must both be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+      raise ValueError('lat must be within [-90, 90] and lon within [-180, 180]')
+    return lat, lon
+  city, state = values.get('city', '').strip(), values.get('state', '').strip()
+  if not state:
+    raise ValueError('lat and lon, or city and state, are required')
+  point = geocode(city, state)
+  if point is None:
+    raise ValueError('unknown state %s' % state)
+  return point
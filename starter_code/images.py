@@ -0,0 +1,232 @@
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, Request, build_opener
+
+from flask import current_app
+
+from models import db, Venue, Artist, Image
+from jobs import job, enqueue, after_commit
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Image thumbnails.
+#----------------------------------------------------------------------------#
+
+# Venue and artist image_links are fetched once, in the background by the
+# fetch-image job, and resized into thumbnails stored on disk under the
+# SHA-256 of the fetched bytes:
+#
+#   IMAGE_CACHE_DIR/ab/abcdef.../small.webp
+#
+# The same picture behind several links is stored once, and the content of
+# /images/<digest>/<size>.<format> can never change, so it is served with
+# a year-long immutable Cache-Control and the digest as its ETag. Pages
+# show a <picture> of the WebP and JPEG thumbnails once the row's
+# image_digest is set, and the link itself until then. Resizing needs
+# Pillow; the fetcher is any callable taking a url and returning bytes,
+# HttpFetcher by default.
+
+# size name -> the box thumbnails are fitted into
+SIZES = {
+  'small': (320, 320),
+  'large': (800, 800)
+}
+
+# format name -> (Pillow format, mimetype, save options)
+FORMATS = {
+  'webp': ('WEBP', 'image/webp', {"quality": 80, "method": 4}),
+  'jpg': ('JPEG', 'image/jpeg', {"quality": 82, "optimize": True, "progressive": True})
+}
+
+class FetchError(Exception):
+  pass
+
+class HttpFetcher(object):
+  """Fetches http(s) links with a timeout and a size limit. Links to
+  loopback, private or link-local addresses are refused unless
+  allow_private, e.g. for a local fixture server in tests.
+
+  Each host, redirects included, is resolved once, at connect time, and
+  the connection goes to the addresses that were checked. Looking it up
+  again would let a DNS server answer with an internal address the second
+  time (DNS rebinding). The Host header and TLS certificate check still
+  use the host name. Proxies are not used, since a proxy would resolve the
+  host itself.
+  """
+
+  def __init__(self, timeout=10, max_bytes=10 * 1024 * 1024, allow_private=False):
+    self.timeout = timeout
+    self.max_bytes = max_bytes
+    self.allow_private = allow_private
+    fetcher = self
+
+    class CheckedHTTPConnection(HTTPConnection):
+      def __init__(self, *args, **kwargs):
+        super(CheckedHTTPConnection, self).__init__(*args, **kwargs)
+        self._create_connection = fetcher.connect
+
+    class CheckedHTTPSConnection(HTTPSConnection):
+      def __init__(self, *args, **kwargs):
+        super(CheckedHTTPSConnection, self).__init__(*args, **kwargs)
+        self._create_connection = fetcher.connect
+
+    class CheckedHTTPHandler(HTTPHandler):
+      def http_open(self, req):
+        return self.do_open(CheckedHTTPConnection, req)
+
+    class CheckedHTTPSHandler(HTTPSHandler):
+      def https_open(self, req):
+        return self.do_open(CheckedHTTPSConnection, req, context=self._context)
+
+    class CheckedRedirectHandler(HTTPRedirectHandler):
+      def redirect_request(self, req, fp, code, msg, headers, newurl):
+        fetcher.check_url(newurl)
+        return HTTPRedirectHandler.redirect_request(self, req, fp, code, msg, headers, newurl)
+
+    self.opener = build_opener(ProxyHandler({}), CheckedHTTPHandler, CheckedHTTPSHandler, CheckedRedirectHandler)
+
+  def check_url(self, url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+      raise FetchError('not an http(s) link: %s' % url)
+
+  def connect(self, address, timeout, source_address=None):
+    """socket.create_connection() to one of the addresses host resolves
+    to, once all of them were found public."""
+    host, port = address
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    if not self.allow_private:
+      for ip in map(ipaddress.ip_address, addresses):
+        if not ip.is_global:
+          raise FetchError('%s resolves to non-public address %s' % (host, ip))
+    error = None
+    for ip in addresses:
+      try:
+        return socket.create_connection((ip, port), timeout, source_address)
+      except OSError as e:
+        error = e
+    raise error
+
+  def __call__(self, url):
+    self.check_url(url)
+    request = Request(url, headers={"User-Agent": 'fyyur-image-fetcher', "Accept": 'image/*'})
+    with self.opener.open(request, timeout=self.timeout) as response:
+      content_type = response.headers.get('Content-Type', '')
+      if not content_type.startswith('image/'):
+        raise FetchError('%s is %s, not an image' % (url, content_type or 'untyped'))
+      data = response.read(self.max_bytes + 1)
+    if len(data) > self.max_bytes:
+      raise FetchError('%s is larger than %d bytes' % (url, self.max_bytes))
+    return data
+
+class _ImageStoreState(object):
+  """An app's thumbnail directory and fetcher."""
+
+  def __init__(self, directory, fetcher):
+    self.directory = directory
+    self.fetcher = fetcher
+
+class ImageStore(object):
+  """The thumbnail directory and the fetcher filling it, of the current app.
+
+  Configured from IMAGE_CACHE_DIR, IMAGE_FETCH_TIMEOUT, IMAGE_MAX_BYTES
+  and IMAGE_FETCH_ALLOW_PRIVATE, or with an explicit fetcher passed to
+  init_app(). Each app keeps its own in app.extensions['image_store'].
+  """
+
+  def init_app(self, app, fetcher=None):
+    app.extensions['image_store'] = _ImageStoreState(
+      app.config['IMAGE_CACHE_DIR'] or os.path.join(app.instance_path, 'images'),
+      fetcher or HttpFetcher(
+        timeout=app.config['IMAGE_FETCH_TIMEOUT'],
+        max_bytes=app.config['IMAGE_MAX_BYTES'],
+        allow_private=app.config['IMAGE_FETCH_ALLOW_PRIVATE']
+      )
+    )
+
+  @property
+  def directory(self):
+    return current_app.extensions['image_store'].directory
+
+  @property
+  def fetcher(self):
+    return current_app.extensions['image_store'].fetcher
+
+  def path(self, digest, size, format):
+    return os.path.join(self.directory, digest[:2], digest, '%s.%s' % (size, format))
+
+  def has(self, digest):
+    return all(os.path.exists(self.path(digest, size, format)) for size in SIZES for format in FORMATS)
+
+  def save(self, data):
+    """Write the thumbnails of the image data, unless stored already, and
+    return its (digest, width, height)."""
+    # imported here, so web processes that only serve thumbnails never load it
+    from PIL import Image as PillowImage, ImageOps
+
+    digest = hashlib.sha256(data).hexdigest()
+    with PillowImage.open(io.BytesIO(data)) as original:
+      picture = ImageOps.exif_transpose(original).convert('RGB')
+    if not self.has(digest):
+      os.makedirs(os.path.dirname(self.path(digest, 'small', 'jpg')), exist_ok=True)
+      for size, box in SIZES.items():
+        thumbnail = picture.copy()
+        thumbnail.thumbnail(box, PillowImage.LANCZOS)
+        for format, (pillow_format, _, options) in FORMATS.items():
+          # written aside and renamed, so a file is either whole or absent
+          path = self.path(digest, size, format)
+          fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+          with os.fdopen(fd, 'wb') as f:
+            thumbnail.save(f, pillow_format, **options)
+          os.replace(temporary, path)
+    return digest, picture.width, picture.height
+
+image_store = ImageStore()
+
+#----------------------------------------------------------------------------#
+# Jobs.
+#----------------------------------------------------------------------------#
+
+@job('fetch-image', max_attempts=3)
+def fetch_image(url):
+  """Fetch url once, store its thumbnails and point the venues and artists
+  linking to it at them."""
+  image = Image.query.get(url)
+  if image is None or not image_store.has(image.digest):
+    digest, width, height = image_store.save(image_store.fetcher(url))
+    image = image or Image(url=url)
+    image.digest, image.width, image.height = digest, width, height
+    db.session.add(image)
+    db.session.flush()
+  for model in (Venue, Artist):
+    table = model.__table__
+    updated = db.session.execute(table.update().
+      where(db.and_(table.c.image_link == url, table.c.image_digest.is_distinct_from(image.digest))).
+      values(image_digest=image.digest).returning(table.c.id))
+    after_commit(page_cache.invalidate, model.__tablename__[:-1], *[i for i, in updated])
+
+def queue_image_fetch(profile):
+  """Queue fetching a venue's or artist's image_link if it is new or has
+  changed; call it before the commit, see jobs.enqueue()."""
+  if profile.image_link and db.inspect(profile).attrs.image_link.history.has_changes():
+    enqueue('fetch-image', url=profile.image_link)
+
+def queue_image_fetches(full=False):
+  """Queue a fetch of every link some venue or artist has no thumbnails
+  of yet, or of every link with full=True. Returns how many."""
+  links = set()
+  for model in (Venue, Artist):
+    query = db.session.query(model.image_link).filter(model.image_link.isnot(None), model.image_link != '')
+    if not full:
+      query = query.filter(model.image_digest.is_(None))
+    links.update(link for link, in query.distinct())
+  for link in sorted(links):
+    enqueue('fetch-image', url=link)
+  db.session.commit()
+  return len(links)
@@ -0,0 +1,188 @@
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from psycopg2.extras import execute_values
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from geocoder import geocode, location
+from models import db, Venue, Artist, Show, refresh_show_counts
+from scheduling import SHOW_COLUMNS, insert_shows
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Streams CSV or JSONL files into the catalog in chunks. Every row goes
+# through the same form the create handlers use, show foreign keys are
+# checked with one query per chunk, and valid rows are written with a
+# single multi-row INSERT per chunk. Shows that would overlap another show
+# at their venue or by their artist are skipped by that INSERT and rejected.
+
+IMPORTS = {
+  'venues': {
+    "form": VenueForm,
+    "model": Venue,
+    "columns": ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                'website', 'genres', 'seeking_talent', 'seeking_description', 'latitude', 'longitude')
+  },
+  'artists': {
+    "form": ArtistForm,
+    "model": Artist,
+    "columns": ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                'website', 'genres', 'seeking_venue', 'seeking_description')
+  },
+  'shows': {
+    "form": ShowForm,
+    "model": Show,
+    "columns": SHOW_COLUMNS
+  }
+}
+
+def read_records(path):
+  """Yield (line number, record) pairs from a .csv or .jsonl file."""
+  with open(path, newline='') as f:
+    if path.endswith('.csv'):
+      reader = csv.DictReader(f)
+      for record in reader:
+        # multi-valued cells hold comma separated values
+        if record.get('genres'):
+          record['genres'] = [g.strip() for g in record['genres'].split(',') if g.strip()]
+        yield reader.line_num, record
+    else:
+      for line, text in enumerate(f, 1):
+        if text.strip():
+          yield line, json.loads(text)
+
+def to_formdata(record):
+  formdata = MultiDict()
+  for key, value in record.items():
+    if value is None:
+      continue
+    for v in (value if isinstance(value, list) else [value]):
+      formdata.add(key, str(v))
+  return formdata
+
+def validate(kind, form, record):
+  # one form instance is re-processed per row, building a form per row
+  # costs more than validating it
+  form.process(to_formdata(record))
+  if not form.validate():
+    return None, form.errors
+  row = dict((name, form[name].data) for name in form._fields if name != 'csrf_token')
+  # same rule as the create handlers: a seeking description means seeking
+  if kind == 'venues':
+    row['seeking_talent'] = bool(row['seeking_description'])
+    # an exported venue keeps its location, any other is placed like venues
+    # created through the ORM, see models.venue_geocoded()
+    if record.get('latitude') not in (None, '') or record.get('longitude') not in (None, ''):
+      try:
+        row['latitude'], row['longitude'] = location({"lat": str(record.get('latitude') or ''),
+                                                      "lon": str(record.get('longitude') or '')})
+      except ValueError as e:
+        return None, {"latitude": [str(e)]}
+    else:
+      row['latitude'], row['longitude'] = geocode(row['city'], row['state']) or (None, None)
+  elif kind == 'artists':
+    row['seeking_venue'] = bool(row['seeking_description'])
+  elif kind == 'shows':
+    # an exported show keeps its end_time, any other lasts duration minutes
+    if record.get('end_time'):
+      try:
+        row['end_time'] = datetime.fromisoformat(str(record['end_time']))
+      except ValueError:
+        return None, {"end_time": ['Not a valid datetime value.']}
+      if row['end_time'] <= row['start_time']:
+        return None, {"end_time": ['Must be after start_time.']}
+    else:
+      row['end_time'] = row['start_time'] + timedelta(minutes=row['duration'])
+  return row, None
+
+def missing_foreign_keys(rows):
+  """Return the ids referenced by rows that do not exist, per column."""
+  missing = {}
+  for column, model in (('venue_id', Venue), ('artist_id', Artist)):
+    ids = set(row[column] for row in rows)
+    found = set(i for i, in db.session.query(model.id).filter(model.id.in_(ids)))
+    missing[column] = ids - found
+  return missing
+
+def insert_rows(kind, rows):
+  """Insert rows and return the positions of those skipped as conflicting."""
+  table = IMPORTS[kind]['model'].__table__
+  columns = IMPORTS[kind]['columns']
+  values = [tuple(row[c] for c in columns) for row in rows]
+  if kind == 'shows':
+    return [i for i, show_id in enumerate(insert_shows(values)) if show_id is None]
+  cursor = db.session.connection().connection.cursor()
+  execute_values(
+    cursor,
+    'INSERT INTO %s (%s) VALUES %%s' % (table.name, ', '.join(columns)),
+    values,
+    page_size=len(rows)
+  )
+  return []
+
+def import_file(kind, path, chunk_size=5000, rejects=None, progress=None):
+  """Import path into the kind table and return the run's statistics.
+
+  Rejected rows are written to the rejects file object as JSON lines with
+  their line number and errors. progress, if given, is called with the
+  statistics after every chunk.
+  """
+  stats = {"kind": kind, "read": 0, "imported": 0, "rejected": 0, "seconds": 0.0}
+  started = time.perf_counter()
+
+  def reject(line, record, errors):
+    stats["rejected"] += 1
+    if rejects is not None:
+      rejects.write(json.dumps({"line": line, "errors": errors, "record": record}, default=str) + '\n')
+
+  form = IMPORTS[kind]['form'](meta={'csrf': False})
+  records = read_records(path)
+  while True:
+    chunk = list(islice(records, chunk_size))
+    if not chunk:
+      break
+    stats["read"] += len(chunk)
+
+    valid = []
+    for line, record in chunk:
+      row, errors = validate(kind, form, record)
+      if errors:
+        reject(line, record, errors)
+      else:
+        valid.append((line, record, row))
+
+    if kind == 'shows' and valid:
+      missing = missing_foreign_keys([row for _, _, row in valid])
+      checked = []
+      for line, record, row in valid:
+        errors = dict((c, ['No such id %s' % row[c]]) for c in missing if row[c] in missing[c])
+        if errors:
+          reject(line, record, errors)
+        else:
+          checked.append((line, record, row))
+      valid = checked
+
+    if valid:
+      skipped = insert_rows(kind, [row for _, _, row in valid])
+      db.session.commit()
+      for i in skipped:
+        line, record, _ = valid[i]
+        reject(line, record, {"start_time": ['Overlaps another show at this venue or by this artist']})
+      stats["imported"] += len(valid) - len(skipped)
+
+    stats["seconds"] = time.perf_counter() - started
+    if progress is not None:
+      progress(stats)
+
+  if kind == 'shows' and stats["imported"]:
+    # the multi-row INSERT bypasses the show counter hooks
+    refresh_show_counts(full=True)
+
+  stats["seconds"] = time.perf_counter() - started
+  return stats
@@ -0,0 +1,208 @@
+import json
+import logging
+import random
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from flask import current_app
+
+from models import db, Job
+
+log = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Work that follows a write but need not hold up its response, e.g.
+# recomputing recommendations, is queued as a row of the jobs table. The
+# row is added to the write's own transaction, so a job exists exactly when
+# the write committed. `flask run-worker` runs a pool of threads that each
+# claim the oldest due job with FOR UPDATE SKIP LOCKED, so any number of
+# workers share the queue without blocking on each other's rows, and lease
+# it for JOB_LEASE_SECONDS: a job whose worker died is claimed again once
+# its lease runs out. The job's own statements and its 'done' mark commit
+# together. A job that raises is retried after JOB_BACKOFF_SECONDS, doubling
+# per attempt, until it runs out of attempts and is marked 'failed'.
+
+JobType = namedtuple('JobType', ('function', 'max_attempts'))
+
+# job name -> JobType, filled by @job
+JOBS = {}
+
+def job(name, max_attempts=5):
+  """Register a function as the job name. It is called with the job's
+  arguments as keywords, inside an app context, and must not commit."""
+  def register(function):
+    JOBS[name] = JobType(function, max_attempts)
+    return function
+  return register
+
+def after_commit(callback, *args):
+  """Call callback(*args) once the running job has committed, e.g. to drop
+  cached pages it changed, so no reader can cache the old rows again in
+  between; a job that fails never calls it."""
+  db.session.info.setdefault('job_after_commit', []).append((callback, args))
+
+def enqueue(name, delay=None, **args):
+  """Queue the job name with JSON-serialisable args in the current
+  transaction; it runs after the transaction commits, or delay later."""
+  run_at = db.func.now() + delay if delay else db.func.now()
+  db.session.add(Job(name=name, args=args, max_attempts=JOBS[name].max_attempts, run_at=run_at))
+
+def enqueue_once(name, **args):
+  """enqueue() the job name with args unless the same job is already
+  queued or running, e.g. from a request anyone can repeat. Returns
+  whether it was queued."""
+  # concurrent transactions take turns until commit, so the second one
+  # sees the first one's job
+  db.session.execute(db.text('SELECT pg_advisory_xact_lock(hashtext(:key))'),
+                     {"key": name + json.dumps(args, sort_keys=True)})
+  pending = db.session.query(Job.query.filter(
+    Job.name == name, Job.args == args, Job.status.in_(('queued', 'running'))).exists()).scalar()
+  if not pending:
+    enqueue(name, **args)
+  return not pending
+
+#----------------------------------------------------------------------------#
+# Running jobs.
+#----------------------------------------------------------------------------#
+
+CLAIM = """
+UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = now(), run_at = now() + :lease
+WHERE id = (
+  SELECT id FROM jobs WHERE status IN ('queued', 'running') AND run_at <= now()
+  ORDER BY run_at, id LIMIT 1 FOR UPDATE SKIP LOCKED
+)
+RETURNING id, name, args, attempts, max_attempts
+"""
+
+def claim():
+  """Lease the oldest due job to this worker and return it, or None."""
+  lease = timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+  row = db.session.execute(db.text(CLAIM), {"lease": lease}).first()
+  db.session.commit()
+  return row
+
+def backoff(attempts):
+  """Delay before the retry following attempt number attempts, with up to
+  10% jitter so jobs that failed together do not retry together."""
+  config = current_app.config
+  delay = min(config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1), config['JOB_MAX_BACKOFF_SECONDS'])
+  return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+def run_job(row):
+  """Run a claimed job and record how it went. Returns True if it ran."""
+  table = Job.__table__
+  this_job = table.update().where(table.c.id == row.id)
+  try:
+    if row.name not in JOBS:
+      raise LookupError('no job named %r' % row.name)
+    JOBS[row.name].function(**row.args)
+    db.session.execute(this_job.values(status='done', finished_at=db.func.now(), last_error=None))
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    db.session.info.pop('job_after_commit', None)
+    error = traceback.format_exc()
+    if row.attempts >= row.max_attempts:
+      log.error('job %d %s failed for good after %d attempts\n%s', row.id, row.name, row.attempts, error)
+      db.session.execute(this_job.values(status='failed', finished_at=db.func.now(), last_error=error))
+    else:
+      log.warning('job %d %s failed, attempt %d of %d\n%s', row.id, row.name, row.attempts, row.max_attempts, error)
+      db.session.execute(this_job.values(status='queued', run_at=db.func.now() + backoff(row.attempts),
+                                         last_error=error))
+    db.session.commit()
+    return False
+  for callback, args in db.session.info.pop('job_after_commit', ()):
+    try:
+      callback(*args)
+    except Exception:
+      # the job is done all the same
+      log.exception('job %d %s: after-commit callback failed', row.id, row.name)
+  return True
+
+def work(app, stop, burst=False):
+  """One worker thread: run due jobs until stop is set, or with burst=True
+  until the queue has no due job left."""
+  with app.app_context():
+    try:
+      while not stop.is_set():
+        try:
+          row = claim()
+          if row is not None:
+            run_job(row)
+            continue
+        except Exception:
+          # e.g. the database restarting; a job claimed meanwhile is taken
+          # over when its lease runs out
+          log.exception('job worker error')
+          db.session.rollback()
+        if burst:
+          return
+        stop.wait(app.config['JOB_POLL_SECONDS'])
+    finally:
+      db.session.remove()
+
+def prune_jobs(hours):
+  """Delete jobs that finished more than hours ago, failed ones too."""
+  table = Job.__table__
+  deleted = db.session.execute(table.delete().where(
+    table.c.finished_at < db.func.now() - timedelta(hours=hours))).rowcount
+  db.session.commit()
+  return deleted
+
+def run_worker(app, threads, burst=False, stop=None):
+  """Run threads workers until stop is set (or, with burst=True, until the
+  queue is drained), pruning old finished jobs every minute meanwhile."""
+  stop = stop or threading.Event()
+  with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job-worker') as pool:
+    workers = [pool.submit(work, app, stop, burst) for _ in range(threads)]
+    with app.app_context():
+      try:
+        while not all(w.done() for w in workers):
+          prune_jobs(app.config['JOB_RETENTION_HOURS'])
+          db.session.remove()
+          wait(workers, timeout=60)
+      finally:
+        stop.set()
+    for w in workers:
+      w.result()
+
+#----------------------------------------------------------------------------#
+# Statistics.
+#----------------------------------------------------------------------------#
+
+QUEUE_DEPTH = """
+SELECT name,
+       count(*) FILTER (WHERE status = 'queued' AND run_at <= now()) AS due,
+       count(*) FILTER (WHERE status = 'queued' AND run_at > now()) AS waiting,
+       count(*) FILTER (WHERE status = 'running') AS running,
+       extract(epoch FROM now() - min(run_at) FILTER (WHERE status = 'queued' AND run_at <= now()))::float AS oldest_due_seconds
+FROM jobs WHERE status IN ('queued', 'running')
+GROUP BY name ORDER BY name
+"""
+
+# latency is from enqueueing to finishing, retries included
+FINISHED = """
+SELECT name,
+       count(*) FILTER (WHERE status = 'done') AS done,
+       count(*) FILTER (WHERE status = 'failed') AS failed,
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM finished_at - enqueued_at)) AS latency_p50_seconds,
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY extract(epoch FROM finished_at - enqueued_at)) AS latency_p95_seconds,
+       avg(extract(epoch FROM finished_at - started_at))::float AS run_avg_seconds
+FROM jobs WHERE finished_at >= now() - :window
+GROUP BY name ORDER BY name
+"""
+
+def job_stats(window=timedelta(hours=1)):
+  """Queue depth per job name, and counts and latencies of the jobs that
+  finished within window."""
+  return {
+    "queue": [dict(row) for row in db.session.execute(db.text(QUEUE_DEPTH))],
+    "finished": [dict(row) for row in db.session.execute(db.text(FINISHED), {"window": window})],
+    "window_seconds": window.total_seconds()
+  }
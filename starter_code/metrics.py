@@ -0,0 +1,59 @@
+from bisect import bisect_left
+from threading import Lock
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+class Histogram(object):
+  """Cumulative histogram with fixed upper bounds, in the Prometheus sense."""
+
+  def __init__(self, buckets):
+    self.buckets = tuple(sorted(buckets))
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self._lock = Lock()
+
+  def observe(self, value):
+    with self._lock:
+      self.counts[bisect_left(self.buckets, value)] += 1
+      self.count += 1
+      self.sum += value
+
+  def snapshot(self):
+    with self._lock:
+      cumulative = []
+      total = 0
+      for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+        total += count
+        cumulative.append(('+Inf' if bound == float('inf') else bound, total))
+      return {"buckets": cumulative, "count": self.count, "sum": self.sum}
+
+#----------------------------------------------------------------------------#
+# Prometheus text exposition.
+#----------------------------------------------------------------------------#
+
+def _labels(labels):
+  if not labels:
+    return ''
+  return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                           for k, v in sorted(labels.items()))
+
+def metric_lines(name, kind, help, samples):
+  """Format samples, a list of (labels, value) pairs, of a counter or gauge."""
+  lines = ['# HELP %s %s' % (name, help), '# TYPE %s %s' % (name, kind)]
+  for labels, value in samples:
+    lines.append('%s%s %s' % (name, _labels(labels), value))
+  return lines
+
+def histogram_lines(name, help, samples):
+  """Format samples, a list of (labels, Histogram) pairs."""
+  lines = ['# HELP %s %s' % (name, help), '# TYPE %s histogram' % name]
+  for labels, histogram in samples:
+    snapshot = histogram.snapshot()
+    for bound, count in snapshot["buckets"]:
+      lines.append('%s_bucket%s %d' % (name, _labels(dict(labels, le=bound)), count))
+    lines.append('%s_sum%s %s' % (name, _labels(labels), snapshot["sum"]))
+    lines.append('%s_count%s %d' % (name, _labels(labels), snapshot["count"]))
+  return lines
@@ -0,0 +1,49 @@
+"""venue and artist recommendations
+
+Revision ID: 0b8e4d61c25a
+Revises: f3b07c9d4e16
+Create Date: 2026-10-18 20:48:17.224905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b8e4d61c25a'
+down_revision = 'f3b07c9d4e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL: every profile is computed by the first `flask refresh-recommendations`
+    op.add_column('venues', sa.Column('recommended_at', sa.DateTime(), nullable=True))
+    op.add_column('artists', sa.Column('recommended_at', sa.DateTime(), nullable=True))
+    op.create_table('venue_recommendations',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id')
+    )
+    op.create_index('ix_venue_recommendations_artist_id', 'venue_recommendations', ['artist_id'], unique=False)
+    op.create_table('artist_recommendations',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'venue_id')
+    )
+    op.create_index('ix_artist_recommendations_venue_id', 'artist_recommendations', ['venue_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_recommendations_venue_id', table_name='artist_recommendations')
+    op.drop_table('artist_recommendations')
+    op.drop_index('ix_venue_recommendations_artist_id', table_name='venue_recommendations')
+    op.drop_table('venue_recommendations')
+    op.drop_column('artists', 'recommended_at')
+    op.drop_column('venues', 'recommended_at')
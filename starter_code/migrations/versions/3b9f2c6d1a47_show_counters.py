@@ -0,0 +1,39 @@
+"""show counters on venues and artists
+
+Revision ID: 3b9f2c6d1a47
+Revises: e7fc1471b1be
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f2c6d1a47'
+down_revision = 'e7fc1471b1be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('show_counts_as_of', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        # backfill from the existing shows
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM shows '
+            'WHERE shows.{fk} = {table}.id AND shows.start_time > {table}.show_counts_as_of), '
+            'past_shows_count = (SELECT count(*) FROM shows '
+            'WHERE shows.{fk} = {table}.id AND shows.start_time <= {table}.show_counts_as_of)'
+            .format(table=table, fk=fk)
+        )
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'show_counts_as_of')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
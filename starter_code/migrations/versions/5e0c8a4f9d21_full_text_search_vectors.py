@@ -0,0 +1,65 @@
+"""full-text search vectors on venues and artists
+
+Revision ID: 5e0c8a4f9d21
+Revises: d2a6e93b7c10
+Create Date: 2026-10-18 12:41:52.306117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c8a4f9d21'
+down_revision = 'd2a6e93b7c10'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(array_to_string({row}genres, ' '), '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({row}city, '') || ' ' || coalesce({row}state, '')), 'C')
+"""
+
+
+def upgrade():
+    op.execute("""
+        CREATE FUNCTION search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {vector};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """.format(vector=SEARCH_VECTOR.format(row='NEW.')))
+
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute('UPDATE {table} SET search_vector = {vector}'.format(
+            table=table, vector=SEARCH_VECTOR.format(row='')))
+        op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'],
+                        unique=False, postgresql_using='gin')
+        op.execute(
+            'CREATE TRIGGER {table}_search_vector_update '
+            'BEFORE INSERT OR UPDATE OF name, city, state, genres ON {table} '
+            'FOR EACH ROW EXECUTE PROCEDURE search_vector_update()'.format(table=table)
+        )
+
+    # the searches no longer use ilike, so the trigram indexes of
+    # 8c41d7e0f2b5 (where pg_trgm was available) are dead weight
+    op.execute('DROP INDEX IF EXISTS ix_venues_name_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_artists_name_trgm')
+
+
+def downgrade():
+    has_pg_trgm = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    ).scalar() is not None
+    if has_pg_trgm:
+        op.execute('CREATE INDEX ix_venues_name_trgm ON venues USING gin (name gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_artists_name_trgm ON artists USING gin (name gin_trgm_ops)')
+    for table in ('artists', 'venues'):
+        op.execute('DROP TRIGGER {table}_search_vector_update ON {table}'.format(table=table))
+        op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION search_vector_update()')
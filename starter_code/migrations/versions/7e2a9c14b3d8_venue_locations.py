@@ -0,0 +1,30 @@
+"""venue locations
+
+Revision ID: 7e2a9c14b3d8
+Revises: 0b8e4d61c25a
+Create Date: 2026-10-18 21:37:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2a9c14b3d8'
+down_revision = '0b8e4d61c25a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL until `flask geocode-venues` places the existing venues
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index('ix_venues_location', 'venues', [sa.text('point(longitude, latitude)')], unique=False,
+                    postgresql_using='gist', postgresql_where=sa.text('latitude IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_venues_location', table_name='venues')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
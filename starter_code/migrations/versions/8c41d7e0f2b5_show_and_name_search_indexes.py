@@ -0,0 +1,46 @@
+"""show and name search indexes
+
+Revision ID: 8c41d7e0f2b5
+Revises: 3b9f2c6d1a47
+Create Date: 2026-10-18 10:03:27.530912
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41d7e0f2b5'
+down_revision = '3b9f2c6d1a47'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def _has_pg_trgm():
+    return op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar() is not None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+
+    # trigram indexes back the ilike('%term%') name searches
+    if not _has_pg_trgm():
+        logger.warning('pg_trgm is not available, skipping the name search indexes.')
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX ix_venues_name_trgm ON venues USING gin (name gin_trgm_ops)')
+    op.execute('CREATE INDEX ix_artists_name_trgm ON artists USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_artists_name_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_venues_name_trgm')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
@@ -0,0 +1,43 @@
+"""background jobs
+
+Revision ID: a4c6e81f5d27
+Revises: 7e2a9c14b3d8
+Create Date: 2026-10-18 22:41:09.530172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c6e81f5d27'
+down_revision = '7e2a9c14b3d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('args', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False),
+    sa.Column('status', sa.String(length=16), server_default='queued', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('max_attempts', sa.Integer(), server_default='5', nullable=False),
+    sa.Column('run_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('enqueued_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_run_at_id', 'jobs', ['run_at', 'id'], unique=False,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_jobs_finished_at', 'jobs', ['finished_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_finished_at', table_name='jobs')
+    op.drop_index('ix_jobs_run_at_id', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,26 @@
+"""updated_at row versions
+
+Revision ID: a71f5d3c28e6
+Revises: 5e0c8a4f9d21
+Create Date: 2026-10-18 14:05:11.642387
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a71f5d3c28e6'
+down_revision = '5e0c8a4f9d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,55 @@
+"""show end times and double-booking constraints
+
+Revision ID: c5d81e2f7a93
+Revises: a71f5d3c28e6
+Create Date: 2026-10-18 18:12:40.118264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d81e2f7a93'
+down_revision = 'a71f5d3c28e6'
+branch_labels = None
+depends_on = None
+
+# Existing shows get the form's default two hours, cut short where the
+# venue or the artist has a later show. Shows already double-booked at the
+# same start time keep only the latest one's range; the others end as they
+# start and no longer block anything.
+BACKFILL = """
+    UPDATE shows SET end_time = LEAST(shows.start_time + interval '2 hours', nexts.venue_next, nexts.artist_next)
+    FROM (
+        SELECT id,
+               lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS venue_next,
+               lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id) AS artist_next
+        FROM shows
+    ) AS nexts
+    WHERE nexts.id = shows.id
+"""
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute(BACKFILL)
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint('ck_shows_end_time', 'shows', 'end_time >= start_time')
+    # Committed first: until then the rows' old versions, without an end
+    # time and so overlapping everything after their start, would be
+    # indexed and checked too, several times slower.
+    with op.get_context().autocommit_block():
+        # ids as one-element ranges, so plain GiST can index them without btree_gist
+        for column in ('venue_id', 'artist_id'):
+            op.execute(
+                "ALTER TABLE shows ADD CONSTRAINT ex_shows_{column}_time EXCLUDE USING gist "
+                "(int4range({column}, {column}, '[]') WITH =, tsrange(start_time, end_time) WITH &&)".format(column=column)
+            )
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_id_time', 'shows')
+    op.drop_constraint('ex_shows_venue_id_time', 'shows')
+    op.drop_constraint('ck_shows_end_time', 'shows')
+    op.drop_column('shows', 'end_time')
@@ -0,0 +1,28 @@
+"""listing keyset indexes
+
+Revision ID: d2a6e93b7c10
+Revises: 8c41d7e0f2b5
+Create Date: 2026-10-18 11:20:05.871244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6e93b7c10'
+down_revision = '8c41d7e0f2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_city_state_name_id', 'venues', ['city', 'state', 'name', 'id'], unique=False)
+    op.create_index('ix_artists_name_id', 'artists', ['name', 'id'], unique=False)
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_artists_name_id', table_name='artists')
+    op.drop_index('ix_venues_city_state_name_id', table_name='venues')
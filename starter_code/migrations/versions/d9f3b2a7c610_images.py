@@ -0,0 +1,38 @@
+"""fetched images and thumbnails
+
+Revision ID: d9f3b2a7c610
+Revises: a4c6e81f5d27
+Create Date: 2026-10-18 23:52:31.804417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f3b2a7c610'
+down_revision = 'a4c6e81f5d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('images',
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('url')
+    )
+    op.create_index('ix_images_digest', 'images', ['digest'], unique=False)
+    # NULL until `flask fetch-images` and a worker have fetched the links
+    op.add_column('venues', sa.Column('image_digest', sa.String(length=64), nullable=True))
+    op.add_column('artists', sa.Column('image_digest', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('artists', 'image_digest')
+    op.drop_column('venues', 'image_digest')
+    op.drop_index('ix_images_digest', table_name='images')
+    op.drop_table('images')
@@ -0,0 +1,30 @@
+"""listing filter indexes
+
+Revision ID: f3b07c9d4e16
+Revises: c5d81e2f7a93
+Create Date: 2026-10-18 19:36:08.507311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b07c9d4e16'
+down_revision = 'c5d81e2f7a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.create_index('ix_%s_genres' % table, table, ['genres'], unique=False, postgresql_using='gin')
+        op.create_index('ix_%s_state' % table, table, ['state'], unique=False)
+        op.create_index('ix_%s_lower_city' % table, table, [sa.text('lower(city)')], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index('ix_%s_lower_city' % table, table_name=table)
+        op.drop_index('ix_%s_state' % table, table_name=table)
+        op.drop_index('ix_%s_genres' % table, table_name=table)
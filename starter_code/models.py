@@ -1,10 +1,10 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, ExcludeConstraint
+from replicas import RoutingSQLAlchemy
+from geocoder import geocode
 
-app = Flask(__name__)
-db = SQLAlchemy()
-migrate = Migrate(app, db)
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -12,6 +12,18 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        # keyset order of the /venues listing
+        db.Index('ix_venues_city_state_name_id', 'city', 'state', 'name', 'id'),
+        db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin'),
+        # listing filters, see facets.py
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_state', 'state'),
+        db.Index('ix_venues_lower_city', db.text('lower(city)')),
+        # nearest venues, see catalog.nearest_venues()
+        db.Index('ix_venues_location', db.text('point(longitude, latitude)'), postgresql_using='gist',
+                 postgresql_where=db.text('latitude IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -29,8 +41,43 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String(500))
     shows = db.relationship('Show', backref='venue', lazy=True)
 
+    # show counters, maintained by the Show insert/delete hooks below and
+    # moved from upcoming to past by refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_as_of = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.func.now())
+
+    # full-text search document, written by a database trigger (see search.py)
+    search_vector = db.deferred(db.Column(TSVECTOR))
+
+    # row version for API ETags, see catalog.venue_version()
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
+
+    # when venue_recommendations were last computed for this venue, NULL
+    # once its shows or profile changed (see recommendations.py)
+    recommended_at = db.Column(db.DateTime)
+
+    # city centre from the bundled gazetteer, see geocoder.py and
+    # venue_geocoded() below; NULL for a state the gazetteer does not know
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+
+    # content digest of the fetched image_link, whose thumbnails the pages
+    # show (see images.py); NULL until fetched, and again once image_link
+    # changes
+    image_digest = db.Column(db.String(64))
+
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        # keyset order of the /artists listing
+        db.Index('ix_artists_name_id', 'name', 'id'),
+        db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin'),
+        # listing filters, see Venue
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_state', 'state'),
+        db.Index('ix_artists_lower_city', db.text('lower(city)')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -47,12 +94,250 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String(500))
     shows = db.relationship('Show', backref='artist', lazy=True)
 
+    # show counters, see Venue
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_as_of = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.func.now())
+
+    # full-text search document, see Venue
+    search_vector = db.deferred(db.Column(TSVECTOR))
+
+    # row version, see Venue
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
+
+    # see Venue
+    recommended_at = db.Column(db.DateTime)
+    image_digest = db.Column(db.String(64))
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+# Shows occupy [start_time, end_time). The exclusion constraints index these
+# expressions; ids are compared as one-element ranges so plain GiST can
+# index them without the btree_gist extension.
+SHOW_VENUE = "int4range(venue_id, venue_id, '[]')"
+SHOW_ARTIST = "int4range(artist_id, artist_id, '[]')"
+SHOW_TIME = 'tsrange(start_time, end_time)'
+
 class Show(db.Model):
   __tablename__ = 'shows'
+  __table_args__ = (
+    # profile pages filter on one side of the show plus a start_time range
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # keyset order of the /shows listing
+    db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    # a venue and an artist play one show at a time, see scheduling.py
+    ExcludeConstraint((db.text(SHOW_VENUE), '='), (db.text(SHOW_TIME), '&&'),
+                      name='ex_shows_venue_id_time', using='gist'),
+    ExcludeConstraint((db.text(SHOW_ARTIST), '='), (db.text(SHOW_TIME), '&&'),
+                      name='ex_shows_artist_id_time', using='gist'),
+    db.CheckConstraint('end_time >= start_time', name='ck_shows_end_time'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+  start_time = db.Column(db.DateTime, nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
+
+# The top artists for a venue seeking talent and the top venues for an
+# artist seeking a venue, written by recommendations.py.
+
+class VenueRecommendation(db.Model):
+    __tablename__ = 'venue_recommendations'
+    __table_args__ = (
+        db.Index('ix_venue_recommendations_artist_id', 'artist_id'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+class ArtistRecommendation(db.Model):
+    __tablename__ = 'artist_recommendations'
+    __table_args__ = (
+        db.Index('ix_artist_recommendations_venue_id', 'venue_id'),
+    )
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+# Image links fetched by images.py, with the SHA-256 of what they served;
+# thumbnails are stored on disk under that digest.
+
+class Image(db.Model):
+    __tablename__ = 'images'
+    __table_args__ = (
+        # /images/<digest>/... whose files are missing, see images.py
+        db.Index('ix_images_digest', 'digest'),
+    )
+
+    url = db.Column(db.String(500), primary_key=True)
+    digest = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.now, server_default=db.func.now())
+
+# Background jobs, see jobs.py. A job is 'queued' until a worker claims it,
+# 'running' while the worker holds its lease (run_at is the lease expiry
+# then), and 'done' or 'failed' once it ran or ran out of attempts.
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # what workers claim, oldest first
+        db.Index('ix_jobs_run_at_id', 'run_at', 'id', postgresql_where=db.text("status IN ('queued', 'running')")),
+        # job-stats and pruning of finished jobs
+        db.Index('ix_jobs_finished_at', 'finished_at'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    args = db.Column(JSONB, nullable=False, default=dict, server_default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False, default=5, server_default='5')
+    run_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    enqueued_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# A show counts as upcoming for a venue/artist while it starts after that
+# row's show_counts_as_of, and as past otherwise. Inserting or deleting a
+# show adjusts both rows in the same transaction; refresh_show_counts()
+# moves shows that have started since show_counts_as_of over to past. The
+# same UPDATE marks both rows' recommendations for a refresh.
+
+def _count_show(connection, show, delta):
+    for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+        table = model.__table__
+        is_upcoming = table.c.show_counts_as_of < show.start_time
+        connection.execute(table.update().where(table.c.id == entity_id).values(
+            upcoming_shows_count=table.c.upcoming_shows_count + db.case([(is_upcoming, delta)], else_=0),
+            past_shows_count=table.c.past_shows_count + db.case([(is_upcoming, 0)], else_=delta),
+            recommended_at=None
+        ))
+
+@event.listens_for(Show, 'after_insert')
+def show_inserted(mapper, connection, show):
+    _count_show(connection, show, 1)
+
+@event.listens_for(Show, 'after_delete')
+def show_deleted(mapper, connection, show):
+    _count_show(connection, show, -1)
+
+def count_new_shows(show_ids):
+    """Add shows written without the ORM, e.g. by a multi-row INSERT, to the
+    counters: one UPDATE per table however many shows there are."""
+    for model, fk in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        table = model.__table__
+        is_upcoming = Show.start_time > model.show_counts_as_of
+        added = db.session.query(
+            fk.label('id'),
+            db.func.count(Show.id).filter(is_upcoming).label('upcoming'),
+            db.func.count(Show.id).filter(db.not_(is_upcoming)).label('past')
+        ).join(model, model.id == fk).filter(Show.id.in_(show_ids)).group_by(fk).subquery()
+        db.session.execute(table.update().where(table.c.id == added.c.id).values(
+            upcoming_shows_count=table.c.upcoming_shows_count + added.c.upcoming,
+            past_shows_count=table.c.past_shows_count + added.c.past,
+            recommended_at=None
+        ))
+
+def refresh_show_counts(full=False):
+    """Move shows that started since the last refresh from upcoming to past.
+
+    With full=True the counters are recomputed from the shows table instead,
+    e.g. after rows were loaded without going through the ORM.
+    """
+    now = datetime.now()
+    for model, fk in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        table = model.__table__
+        if full:
+            upcoming = db.select([db.func.count(Show.id)]).\
+                where(db.and_(fk == table.c.id, Show.start_time > now)).as_scalar()
+            past = db.select([db.func.count(Show.id)]).\
+                where(db.and_(fk == table.c.id, Show.start_time <= now)).as_scalar()
+            db.session.execute(table.update().values(
+                upcoming_shows_count=upcoming,
+                past_shows_count=past,
+                show_counts_as_of=now
+            ))
+        else:
+            moved = db.session.query(fk.label('id'), db.func.count(Show.id).label('num_shows')).\
+                join(model, model.id == fk).\
+                filter(Show.start_time > model.show_counts_as_of, Show.start_time <= now).\
+                group_by(fk).subquery()
+            db.session.execute(table.update().where(table.c.id == moved.c.id).values(
+                upcoming_shows_count=table.c.upcoming_shows_count - moved.c.num_shows,
+                past_shows_count=table.c.past_shows_count + moved.c.num_shows,
+                show_counts_as_of=now
+            ))
+    db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Recommendation inputs.
+#----------------------------------------------------------------------------#
+
+# Besides the shows (see _count_show), recommendations are scored on these
+# profile columns; editing any of them marks the row for a refresh.
+RECOMMENDATION_INPUTS = ('genres', 'city', 'state', 'seeking_talent', 'seeking_venue')
+
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_update')
+def profile_updated(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if any(name in attrs and attrs[name].history.has_changes() for name in RECOMMENDATION_INPUTS):
+        target.recommended_at = None
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# A venue is placed when it is created and again when it moves to another
+# city or state, unless the same flush sets its coordinates explicitly.
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+def venue_geocoded(mapper, connection, venue):
+    attrs = db.inspect(venue).attrs
+    if attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes():
+        return
+    if attrs.city.history.has_changes() or attrs.state.history.has_changes():
+        venue.latitude, venue.longitude = geocode(venue.city, venue.state) or (None, None)
+
+def geocode_venues(full=False):
+    """Place the venues that have no location yet, or all of them with
+    full=True: one UPDATE per city. Returns the number of venues placed."""
+    table = Venue.__table__
+    cities = db.session.query(Venue.city, Venue.state).distinct()
+    if not full:
+        cities = cities.filter(Venue.latitude.is_(None))
+    placed = 0
+    for city, state in cities.all():
+        point = geocode(city, state)
+        if point is None:
+            continue
+        placed += db.session.execute(table.update().where(db.and_(table.c.city == city, table.c.state == state)).
+                                     values(latitude=point[0], longitude=point[1])).rowcount
+    db.session.commit()
+    return placed
+
+#----------------------------------------------------------------------------#
+# Images.
+#----------------------------------------------------------------------------#
+
+# The thumbnails of an old image_link are not the new link's; the pages
+# show the link itself until the fetch-image job has caught up.
+
+@event.listens_for(Venue, 'before_update')
+@event.listens_for(Artist, 'before_update')
+def image_link_updated(mapper, connection, target):
+    if db.inspect(target).attrs.image_link.history.has_changes():
+        target.image_digest = None
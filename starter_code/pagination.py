@@ -0,0 +1,76 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort
+from models import db
+from aio import async_reads
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+# Listing pages are ordered by a unique key, e.g. (start_time, id), and each
+# page starts strictly after the key of the last row of the previous page.
+# The key travels as an opaque url-safe cursor, so every page is a single
+# index range scan no matter how deep into the listing it is.
+
+def encode_cursor(key):
+  values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+  try:
+    key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+  except ValueError:
+    abort(400)
+  if not isinstance(key, list) or len(key) != size:
+    abort(400)
+  return key
+
+def cursor_value(column, value):
+  """A cursor value as the type of the column it was taken from. A cursor
+  is only ever edited by hand, so a value of any other type is a bad
+  request rather than an error from the database."""
+  if value is None:
+    return None
+  if isinstance(column.type, db.DateTime):
+    # cursors carry datetimes as ISO strings, compare them as datetimes
+    if isinstance(value, str):
+      try:
+        return datetime.fromisoformat(value)
+      except ValueError:
+        pass
+  elif isinstance(value, column.type.python_type) and not isinstance(value, bool):
+    return value
+  abort(400)
+
+def keyset_query(query, order_by, cursor, page_size):
+  """Filter query to the page after cursor, ordered by order_by, with one
+  extra row to tell whether another page follows."""
+  if cursor:
+    after = [cursor_value(c, v) for c, v in zip(order_by, decode_cursor(cursor, len(order_by)))]
+    query = query.filter(db.tuple_(*order_by) > db.tuple_(*after))
+  return query.order_by(*order_by).limit(page_size + 1)
+
+def keyset_rows(rows, page_size, key):
+  """Trim the rows of a keyset_query() to one page and return them with
+  the next page's cursor."""
+  if len(rows) <= page_size:
+    return rows, None
+  rows = rows[:page_size]
+  return rows, encode_cursor(key(rows[-1]))
+
+def keyset_page(query, order_by, cursor, page_size, key):
+  """Return one page of query ordered by order_by plus the next page's cursor.
+
+  key maps a result row to its values for the order_by columns; the next
+  cursor is None on the last page.
+  """
+  rows = keyset_query(query, order_by, cursor, page_size).all()
+  return keyset_rows(rows, page_size, key)
+
+async def keyset_page_async(query, order_by, cursor, page_size, key):
+  """keyset_page() on the async driver."""
+  rows = await async_reads.fetch(keyset_query(query, order_by, cursor, page_size))
+  return keyset_rows(rows, page_size, key)
@@ -0,0 +1,101 @@
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from metrics import Histogram, metric_lines, histogram_lines
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+# Seconds spent waiting for a connection at checkout.
+CHECKOUT_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class InstrumentedQueuePool(QueuePool):
+  """QueuePool that records how long each checkout waits."""
+
+  def __init__(self, *args, **kwargs):
+    super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+    self.checkout_wait = Histogram(CHECKOUT_WAIT_BUCKETS)
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      return super(InstrumentedQueuePool, self)._do_get()
+    finally:
+      self.checkout_wait.observe(time.perf_counter() - start)
+
+  def recreate(self):
+    pool = super(InstrumentedQueuePool, self).recreate()
+    pool.checkout_wait = self.checkout_wait
+    return pool
+
+def engine_options(config):
+  """Build SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings."""
+  options = {
+    "poolclass": InstrumentedQueuePool,
+    "pool_size": config['DB_POOL_SIZE'],
+    "max_overflow": config['DB_MAX_OVERFLOW'],
+    "pool_timeout": config['DB_POOL_TIMEOUT'],
+    "pool_recycle": config['DB_POOL_RECYCLE'],
+    "pool_pre_ping": config['DB_POOL_PRE_PING']
+  }
+  # PgBouncer in transaction pooling mode rejects the options startup
+  # parameter, the timeout is set per transaction instead, see init_pool()
+  if config['DB_STATEMENT_TIMEOUT_MS'] and not config['DB_PGBOUNCER']:
+    options["connect_args"] = {"options": '-c statement_timeout=%d' % config['DB_STATEMENT_TIMEOUT_MS']}
+  return options
+
+def init_pool(app):
+  app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(engine_options(app.config))
+
+  # engine events are class-wide, so the listener is added once however
+  # many apps are created, and reads the settings of the current one
+  if app.config['DB_PGBOUNCER'] and not event.contains(Engine, 'begin', set_statement_timeout):
+    event.listen(Engine, 'begin', set_statement_timeout)
+
+def set_statement_timeout(conn):
+  """Set the statement timeout per transaction behind PgBouncer."""
+  if not has_app_context():
+    return
+  config = current_app.config
+  timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+  if config.get('DB_PGBOUNCER') and timeout:
+    # a pooled server connection only belongs to us for one transaction,
+    # so session settings would leak; SET LOCAL ends with the transaction
+    conn.connection.cursor().execute('SET LOCAL statement_timeout = %s', (timeout,))
+
+def pool_stats(engine):
+  pool = engine.pool
+  stats = {
+    "class": type(pool).__name__,
+    "status": pool.status()
+  }
+  if isinstance(pool, QueuePool):
+    stats.update({
+      "size": pool.size(),
+      "checked_in": pool.checkedin(),
+      "checked_out": pool.checkedout(),
+      "overflow": pool.overflow(),
+      "max_overflow": pool._max_overflow
+    })
+  if isinstance(pool, InstrumentedQueuePool):
+    stats["checkout_wait_seconds"] = pool.checkout_wait.snapshot()
+  return stats
+
+def pool_metrics(engine):
+  """pool_stats() as Prometheus lines."""
+  stats = pool_stats(engine)
+  lines = []
+  for name in ('size', 'checked_in', 'checked_out', 'overflow'):
+    if name in stats:
+      lines += metric_lines('fyyur_db_pool_' + name, 'gauge', 'Connection pool %s.' % name.replace('_', ' '),
+                            [({}, stats[name])])
+  if isinstance(engine.pool, InstrumentedQueuePool):
+    lines += histogram_lines('fyyur_db_pool_checkout_wait_seconds', 'Time waited for a pooled connection.',
+                             [({}, engine.pool.checkout_wait)])
+  return lines
@@ -0,0 +1,210 @@
+import json
+import time
+from threading import Lock
+
+from flask import (g, current_app, has_app_context, has_request_context, request,
+                   template_rendered, before_render_template)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import Histogram, metric_lines, histogram_lines
+
+#----------------------------------------------------------------------------#
+# Request profiler.
+#----------------------------------------------------------------------------#
+
+# Times every statement a request sends (engine events) and its template
+# rendering (Flask signals). Each response gets a Server-Timing header and
+# a structured log line, per-endpoint totals feed /metrics, and statements
+# slower than PROFILER_SLOW_QUERY_MS are logged with their EXPLAIN plan.
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+SLOWEST_KEPT = 5
+
+class RequestProfile(object):
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_seconds = 0.0
+    self.render_seconds = 0.0
+    self.render_started = None
+    self.slowest = []
+
+  def record_query(self, statement, seconds):
+    self.queries += 1
+    self.db_seconds += seconds
+    self.slowest.append((seconds, statement))
+    self.slowest.sort(key=lambda s: s[0], reverse=True)
+    del self.slowest[SLOWEST_KEPT:]
+
+class EndpointStats(object):
+
+  def __init__(self):
+    self.requests = 0
+    self.queries = 0
+    self.db_seconds = 0.0
+    self.render_seconds = 0.0
+    self.duration = Histogram(REQUEST_BUCKETS)
+    self.queries_per_request = Histogram(QUERY_COUNT_BUCKETS)
+
+class _ProfilerState(object):
+  """An app's profiler settings and per-endpoint totals."""
+
+  def __init__(self, config):
+    self.slow_query_seconds = config.get('PROFILER_SLOW_QUERY_MS', 100) / 1000.0
+    self.explain_slow_queries = config.get('PROFILER_EXPLAIN_SLOW_QUERIES', True)
+    self.log_requests = config.get('PROFILER_LOG_REQUESTS', True)
+    self.endpoints = {}
+    self.lock = Lock()
+
+class Profiler(object):
+  """Profiles the requests of every app it is initialised with; each keeps
+  its settings and totals in app.extensions['profiler']."""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['profiler'] = _ProfilerState(app.config)
+
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+    before_render_template.connect(self.before_render, app)
+    template_rendered.connect(self.after_render, app)
+    # engine events are class-wide, so they are listened to once however
+    # many apps are created
+    if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+  # requests
+
+  def before_request(self):
+    g.profile = RequestProfile()
+
+  def after_request(self, response):
+    profile = g.pop('profile', None)
+    if profile is None:
+      return response
+    total = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unmatched'
+    state = current_app.extensions['profiler']
+
+    response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries", render;dur=%.1f, total;dur=%.1f' % (
+      profile.db_seconds * 1000, profile.queries, profile.render_seconds * 1000, total * 1000))
+
+    with state.lock:
+      stats = state.endpoints.get(endpoint)
+      if stats is None:
+        stats = state.endpoints[endpoint] = EndpointStats()
+      stats.requests += 1
+      stats.queries += profile.queries
+      stats.db_seconds += profile.db_seconds
+      stats.render_seconds += profile.render_seconds
+    stats.duration.observe(total)
+    stats.queries_per_request.observe(profile.queries)
+
+    if state.log_requests:
+      current_app.logger.info(json.dumps({
+        "event": 'request',
+        "endpoint": endpoint,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(total * 1000, 2),
+        "queries": profile.queries,
+        "db_ms": round(profile.db_seconds * 1000, 2),
+        "render_ms": round(profile.render_seconds * 1000, 2),
+        "slowest": [{"ms": round(s * 1000, 2), "statement": q} for s, q in profile.slowest]
+      }))
+    return response
+
+  # templates
+
+  def before_render(self, sender, template, context, **extra):
+    if 'profile' in g:
+      g.profile.render_started = time.perf_counter()
+
+  def after_render(self, sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None and profile.render_started is not None:
+      profile.render_seconds += time.perf_counter() - profile.render_started
+      profile.render_started = None
+
+  # statements
+
+  # A connection runs one statement at a time, so one start time per
+  # connection will do; a statement that fails never reaches
+  # after_cursor_execute and its start time is simply overwritten.
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+  def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+      return
+    seconds = time.perf_counter() - started
+    if has_request_context() and 'profile' in g:
+      g.profile.record_query(statement, seconds)
+    # statements sent outside any app, or by one without the profiler, are
+    # not checked
+    state = current_app.extensions.get('profiler') if has_app_context() else None
+    if state is not None and seconds >= state.slow_query_seconds:
+      self.log_slow_query(state, conn, statement, parameters, seconds, executemany)
+
+  def log_slow_query(self, state, conn, statement, parameters, seconds, executemany):
+    record = {
+      "event": 'slow_query',
+      "ms": round(seconds * 1000, 2),
+      "statement": statement,
+      "endpoint": request.endpoint if has_request_context() else None
+    }
+    if state.explain_slow_queries and not executemany and statement.lstrip().upper().startswith('SELECT'):
+      # a raw DBAPI cursor, so the EXPLAIN itself is not profiled, in a
+      # savepoint, so an EXPLAIN that fails does not abort the transaction
+      # the statement ran in
+      explain = conn.connection.cursor()
+      try:
+        explain.execute('SAVEPOINT explain_slow_query')
+        try:
+          explain.execute('EXPLAIN ' + statement, parameters)
+          record["plan"] = [row[0] for row in explain.fetchall()]
+        finally:
+          explain.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+          explain.execute('RELEASE SAVEPOINT explain_slow_query')
+      except Exception as e:
+        record["plan_error"] = str(e)
+      finally:
+        explain.close()
+    current_app.logger.warning(json.dumps(record))
+
+  # exposition
+
+  @property
+  def endpoints(self):
+    return current_app.extensions['profiler'].endpoints
+
+  def prometheus(self):
+    state = current_app.extensions['profiler']
+    with state.lock:
+      endpoints = sorted(state.endpoints.items())
+    lines = []
+    lines += metric_lines('fyyur_requests_total', 'counter', 'Requests served.',
+                          [({"endpoint": e}, s.requests) for e, s in endpoints])
+    lines += metric_lines('fyyur_db_queries_total', 'counter', 'SQL statements sent.',
+                          [({"endpoint": e}, s.queries) for e, s in endpoints])
+    lines += metric_lines('fyyur_db_seconds_total', 'counter', 'Time spent in SQL statements.',
+                          [({"endpoint": e}, s.db_seconds) for e, s in endpoints])
+    lines += metric_lines('fyyur_render_seconds_total', 'counter', 'Time spent rendering templates.',
+                          [({"endpoint": e}, s.render_seconds) for e, s in endpoints])
+    lines += histogram_lines('fyyur_request_duration_seconds', 'Request duration.',
+                             [({"endpoint": e}, s.duration) for e, s in endpoints])
+    lines += histogram_lines('fyyur_request_queries', 'SQL statements per request.',
+                             [({"endpoint": e}, s.queries_per_request) for e, s in endpoints])
+    return lines
+
+profiler = Profiler()
@@ -0,0 +1,171 @@
+from datetime import datetime
+
+from flask import current_app
+
+from models import db, Venue, Artist, VenueRecommendation, ArtistRecommendation
+from jobs import job, after_commit
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#----------------------------------------------------------------------------#
+
+# A venue seeking talent is recommended the artists seeking a venue that
+# fit it best, and the other way around. A pair scores on
+#
+#   - genre overlap: shared genres over all genres of the two (Jaccard),
+#   - place: the same state, more for the same city,
+#   - booking history: paths venue - artist' - venue' - artist through
+#     recent shows, i.e. the artist played at venues that booked the
+#     venue's own artists; n paths score n / (n + HISTORY_HALF).
+#
+# Candidates share a genre or the state, found through the GIN and state
+# indexes of the listing filters; pairs that already have a show are left
+# out. Each profile's top-K is precomputed into venue_recommendations or
+# artist_recommendations, a sparse row of a few scores, so a profile page
+# reads its recommendations by primary key. Adding or deleting a show, or
+# editing a profile's genres, place or seeking flag, sets recommended_at to
+# NULL (see models.py) and refresh_recommendations() recomputes just those
+# rows; other profiles whose history paths went through them catch up on
+# the next full refresh.
+
+GENRE_WEIGHT = 0.4
+STATE_WEIGHT = 0.1
+CITY_WEIGHT = 0.2
+HISTORY_WEIGHT = 0.3
+HISTORY_HALF = 3
+# shows per venue/artist looked at for booking history, latest first
+HISTORY_SAMPLE = 50
+
+RECOMMEND = """
+WITH owners AS (
+  SELECT id, genres, city, state FROM {owners}
+  WHERE id = ANY(:ids) AND {owner_seeking}
+), booked AS (
+  SELECT DISTINCT {owner_fk} AS owner_id, {other_fk} AS other_id FROM shows
+  WHERE {owner_fk} = ANY(:ids)
+), candidates AS (
+  SELECT o.id AS owner_id, c.id AS other_id,
+         coalesce(cardinality(ARRAY(SELECT unnest(o.genres) INTERSECT SELECT unnest(c.genres)))::float
+                  / nullif(cardinality(ARRAY(SELECT unnest(o.genres) UNION SELECT unnest(c.genres))), 0), 0) AS genre,
+         (c.state = o.state)::int AS same_state,
+         (c.state = o.state AND lower(c.city) = lower(o.city))::int AS same_city
+  FROM owners o
+  JOIN {others} c ON c.{other_seeking} AND (c.genres && o.genres OR c.state = o.state)
+  WHERE NOT EXISTS (SELECT 1 FROM booked b WHERE b.owner_id = o.id AND b.other_id = c.id)
+), peers AS (
+  SELECT DISTINCT o.id AS owner_id, recent.{other_fk} AS peer_id
+  FROM owners o CROSS JOIN LATERAL (
+    SELECT {other_fk} FROM shows WHERE {owner_fk} = o.id ORDER BY start_time DESC LIMIT :sample
+  ) recent
+), neighbours AS (
+  SELECT p.owner_id, recent.{owner_fk} AS neighbour_id, count(DISTINCT p.peer_id) AS weight
+  FROM peers p CROSS JOIN LATERAL (
+    SELECT {owner_fk} FROM shows WHERE {other_fk} = p.peer_id ORDER BY start_time DESC LIMIT :sample
+  ) recent
+  WHERE recent.{owner_fk} <> p.owner_id
+  GROUP BY 1, 2
+), candidate_neighbours AS (
+  SELECT DISTINCT c.id AS other_id, recent.{owner_fk} AS neighbour_id
+  FROM (SELECT DISTINCT other_id AS id FROM candidates) c CROSS JOIN LATERAL (
+    SELECT {owner_fk} FROM shows WHERE {other_fk} = c.id ORDER BY start_time DESC LIMIT :sample
+  ) recent
+), history AS (
+  SELECT n.owner_id, cn.other_id, sum(n.weight)::float AS paths
+  FROM neighbours n JOIN candidate_neighbours cn ON cn.neighbour_id = n.neighbour_id
+  GROUP BY 1, 2
+), scored AS (
+  SELECT c.owner_id, c.other_id,
+         :genre_weight * c.genre + :state_weight * c.same_state + :city_weight * c.same_city
+           + :history_weight * coalesce(h.paths / (h.paths + :history_half), 0) AS score
+  FROM candidates c LEFT JOIN history h ON h.owner_id = c.owner_id AND h.other_id = c.other_id
+)
+INSERT INTO {recommendations} ({owner_fk}, {other_fk}, score)
+SELECT owner_id, other_id, score FROM (
+  SELECT owner_id, other_id, score,
+         row_number() OVER (PARTITION BY owner_id ORDER BY score DESC, other_id) AS rank
+  FROM scored
+) ranked
+WHERE rank <= :top_k
+"""
+
+SIDES = (
+  (Venue, VenueRecommendation, RECOMMEND.format(
+    owners='venues', owner_seeking='seeking_talent', owner_fk='venue_id',
+    others='artists', other_seeking='seeking_venue', other_fk='artist_id',
+    recommendations='venue_recommendations')),
+  (Artist, ArtistRecommendation, RECOMMEND.format(
+    owners='artists', owner_seeking='seeking_venue', owner_fk='artist_id',
+    others='venues', other_seeking='seeking_talent', other_fk='venue_id',
+    recommendations='artist_recommendations')),
+)
+
+def recommend(model, recommendation, statement, ids, top_k):
+  """Recompute the recommendations of the venues or artists ids."""
+  # one computation per profile at a time, a refresh and a job may overlap
+  db.session.query(model.id).filter(model.id.in_(ids)).with_for_update().all()
+  owner_fk = recommendation.venue_id if model is Venue else recommendation.artist_id
+  db.session.query(recommendation).filter(owner_fk.in_(ids)).delete(synchronize_session=False)
+  db.session.execute(db.text(statement), {
+    "ids": ids, "top_k": top_k, "sample": HISTORY_SAMPLE,
+    "genre_weight": GENRE_WEIGHT, "state_weight": STATE_WEIGHT, "city_weight": CITY_WEIGHT,
+    "history_weight": HISTORY_WEIGHT, "history_half": HISTORY_HALF
+  })
+  table = model.__table__
+  db.session.execute(table.update().where(table.c.id.in_(ids)).values(recommended_at=datetime.now()))
+
+def refresh_recommendations(full=False, top_k=6, batch_size=200, progress=None):
+  """Recompute the recommendations of the venues and artists marked for a
+  refresh, or of all of them with full=True, batch_size profiles per
+  transaction. Returns the number of venues and artists refreshed."""
+  counts = {}
+  for model, recommendation, statement in SIDES:
+    stale = db.session.query(model.id).order_by(model.id)
+    if not full:
+      stale = stale.filter(model.recommended_at.is_(None))
+    ids = [i for i, in stale]
+    db.session.rollback()
+    for start in range(0, len(ids), batch_size):
+      recommend(model, recommendation, statement, ids[start:start + batch_size], top_k)
+      db.session.commit()
+      if progress:
+        progress(model.__tablename__, min(start + batch_size, len(ids)), len(ids))
+    counts[model.__tablename__] = len(ids)
+  return counts
+
+@job('recommend')
+def recommend_profiles(venue_ids=(), artist_ids=()):
+  """Job queued by the write handlers: recompute the recommendations of
+  those of the venues and artists marked for a refresh, so an edited
+  profile or a new booking shows up without waiting for the periodic
+  refresh-recommendations."""
+  top_k = current_app.config['RECOMMENDATIONS_PER_PROFILE']
+  for (model, recommendation, statement), ids in zip(SIDES, (venue_ids, artist_ids)):
+    # profiles another worker is recomputing right now are left to it
+    stale = [i for i, in db.session.query(model.id).
+             filter(model.id.in_(ids), model.recommended_at.is_(None)).with_for_update(skip_locked=True)]
+    if stale:
+      recommend(model, recommendation, statement, stale, top_k)
+      # a shared page cache (redis) would go on serving the pages as
+      # rendered before; a per-process one expires them by its TTL
+      after_commit(page_cache.invalidate, model.__tablename__[:-1], *stale)
+
+#----------------------------------------------------------------------------#
+# Reading.
+#----------------------------------------------------------------------------#
+
+def recommended_artists(venue_id):
+  """The (id, name, image_link, image_digest, score) of the artists recommended to a
+  venue, best first; artists that stopped seeking a venue since are
+  left out."""
+  return db.session.query(Artist.id, Artist.name, Artist.image_link, Artist.image_digest, VenueRecommendation.score).\
+    join(VenueRecommendation, VenueRecommendation.artist_id == Artist.id).\
+    filter(VenueRecommendation.venue_id == venue_id, Artist.seeking_venue.is_(True)).\
+    order_by(VenueRecommendation.score.desc(), Artist.id)
+
+def recommended_venues(artist_id):
+  """The venues recommended to an artist, see recommended_artists()."""
+  return db.session.query(Venue.id, Venue.name, Venue.image_link, Venue.image_digest, ArtistRecommendation.score).\
+    join(ArtistRecommendation, ArtistRecommendation.venue_id == Venue.id).\
+    filter(ArtistRecommendation.artist_id == artist_id, Venue.seeking_talent.is_(True)).\
+    order_by(ArtistRecommendation.score.desc(), Venue.id)
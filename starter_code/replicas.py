@@ -0,0 +1,212 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+from metrics import metric_lines
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# Replicas are SQLALCHEMY_BINDS entries named replica_*, see config.py. A
+# GET or HEAD request is pinned to one replica in rotation, round-robin or
+# by fewest checked-out connections, and every statement of the request's
+# session goes there; flushes and all other requests use the primary. A
+# request that writes stores its time in the session cookie, and the same
+# user's reads stay on the primary until any replica in rotation must have
+# caught up. A thread per worker process measures each replica's replay
+# lag and takes replicas that lag too far, or fail, out of rotation.
+
+# Seconds the replica is behind the primary, 0 when it has replayed all WAL
+# it received (an idle primary) or is not a standby at all.
+REPLICA_LAG_SQL = '''
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+END
+'''
+
+POLICIES = ('round_robin', 'least_connections')
+
+class RoutingSession(SignallingSession):
+  """Session that sends the statements of a request pinned to a replica to
+  that replica's engine. Flushes always go to the primary."""
+
+  def get_bind(self, mapper=None, clause=None):
+    replica = g.get('db_replica') if has_request_context() else None
+    if replica is not None and not self._flushing:
+      return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=replica)
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def mark_write(session, flush_context):
+  if has_request_context():
+    g.db_wrote = True
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+class Replica(object):
+
+  def __init__(self, bind):
+    self.bind = bind
+    self.lag = None
+    self.error = None
+    self.checked_at = None
+    self.in_rotation = False
+    self.requests = 0
+
+class _ReplicaRouterState(object):
+  """An app's replicas, routing settings and lag checks."""
+
+  def __init__(self, app):
+    self.app = app
+    self.replicas = [Replica(bind) for bind in sorted(app.config.get('SQLALCHEMY_BINDS') or {})
+                     if bind.startswith('replica')]
+    self.policy = app.config.get('DB_REPLICA_POLICY', 'round_robin')
+    if self.policy not in POLICIES:
+      raise ValueError('Unknown DB_REPLICA_POLICY %r' % self.policy)
+    self.max_lag = app.config.get('DB_REPLICA_MAX_LAG_SECONDS', 5.0)
+    self.check_interval = app.config.get('DB_REPLICA_CHECK_SECONDS', 1.0)
+    # a replica in rotation lags at most max_lag as of its last check
+    self.read_your_writes_seconds = self.max_lag + self.check_interval
+    self.next = itertools.count()
+    self.pid = None
+    self.lock = threading.Lock()
+
+  def engine(self, replica):
+    return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=replica.bind)
+
+class ReplicaRouter(object):
+  """Routes the reads of every app it is initialised with; each keeps its
+  replicas in app.extensions['replica_router']."""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    state = app.extensions['replica_router'] = _ReplicaRouterState(app)
+    if state.replicas:
+      app.before_request(self.before_request)
+      app.after_request(self.after_request)
+
+  @property
+  def replicas(self):
+    return current_app.extensions['replica_router'].replicas
+
+  # requests
+
+  def before_request(self):
+    if request.method not in ('GET', 'HEAD'):
+      return
+    state = current_app.extensions['replica_router']
+    if time.time() - session.get('last_write', 0) < state.read_your_writes_seconds:
+      return
+    replica = self.choose(state)
+    if replica is not None:
+      replica.requests += 1
+      g.db_replica = replica.bind
+
+  def after_request(self, response):
+    if g.pop('db_wrote', False):
+      session['last_write'] = time.time()
+    return response
+
+  def choose(self, state):
+    """The replica of state's app for the next read-only request, None
+    for the primary."""
+    self.start(state)
+    # a check stuck on an unreachable replica must not keep it in rotation
+    fresh_after = time.time() - 3 * state.check_interval
+    live = [r for r in state.replicas if r.in_rotation and r.checked_at >= fresh_after]
+    if not live:
+      return None
+    if state.policy == 'least_connections':
+      return min(live, key=lambda r: state.engine(r).pool.checkedout())
+    return live[next(state.next) % len(live)]
+
+  # lag
+
+  def start(self, state):
+    """Start the lag checks of state's app, once per process and on first
+    use."""
+    if state.pid == os.getpid():
+      return
+    with state.lock:
+      if state.pid == os.getpid():
+        return
+      threading.Thread(target=self._watch, args=(state,), name='replica-lag', daemon=True).start()
+      state.pid = os.getpid()
+
+  def _watch(self, state):
+    while True:
+      for replica in state.replicas:
+        self.check(state, replica)
+      time.sleep(state.check_interval)
+
+  def check(self, state, replica):
+    try:
+      # a raw DBAPI connection, so the check is not profiled
+      connection = state.engine(replica).raw_connection()
+      try:
+        cursor = connection.cursor()
+        cursor.execute(REPLICA_LAG_SQL)
+        lag = cursor.fetchone()[0]
+        cursor.close()
+      finally:
+        connection.close()
+      replica.lag = float(lag or 0)
+      replica.error = None
+    except Exception as e:
+      replica.lag = None
+      replica.error = str(e)
+    replica.checked_at = time.time()
+
+    in_rotation = replica.lag is not None and replica.lag <= state.max_lag
+    if in_rotation != replica.in_rotation:
+      state.app.logger.warning(json.dumps({
+        "event": 'replica_joined' if in_rotation else 'replica_left',
+        "replica": replica.bind,
+        "lag_seconds": replica.lag,
+        "error": replica.error
+      }))
+    replica.in_rotation = in_rotation
+
+  # exposition
+
+  def stats(self):
+    state = current_app.extensions['replica_router']
+    now = time.time()
+    return [{
+      "bind": r.bind,
+      "in_rotation": r.in_rotation,
+      "lag_seconds": r.lag,
+      "error": r.error,
+      "checked_seconds_ago": now - r.checked_at if r.checked_at else None,
+      "requests": r.requests,
+      "checked_out": state.engine(r).pool.checkedout()
+    } for r in state.replicas]
+
+  def prometheus(self):
+    replicas = current_app.extensions['replica_router'].replicas
+    lines = []
+    if not replicas:
+      return lines
+    lines += metric_lines('fyyur_db_replica_in_rotation', 'gauge', 'Whether the replica takes read requests.',
+                          [({"replica": r.bind}, int(r.in_rotation)) for r in replicas])
+    lines += metric_lines('fyyur_db_replica_lag_seconds', 'gauge', 'Replay lag at the last check.',
+                          [({"replica": r.bind}, r.lag) for r in replicas if r.lag is not None])
+    lines += metric_lines('fyyur_db_replica_requests_total', 'counter', 'Requests routed to the replica.',
+                          [({"replica": r.bind}, r.requests) for r in replicas])
+    return lines
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,134 @@
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from models import db, Venue, Show, count_new_shows
+from jobs import enqueue
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# A show occupies its venue and its artist over [start_time, end_time). Two
+# GiST exclusion constraints on shows (see models.Show) reject a show that
+# overlaps another at the same venue or by the same artist, whichever way
+# it is inserted. The queries below spell out the same expressions as the
+# constraints, so they are answered from the constraints' indexes in
+# logarithmic time rather than by scanning a venue's or artist's shows.
+
+EXCLUSION_VIOLATION = '23P01'
+SHOW_COLUMNS = ('artist_id', 'venue_id', 'start_time', 'end_time')
+# dates booked by one book_tour() call at most
+MAX_TOUR_DATES = 500
+
+def during(start, end):
+  """Shows overlapping [start, end)."""
+  return db.func.tsrange(Show.start_time, Show.end_time).op('&&')(db.func.tsrange(start, end))
+
+def one_of(column, entity_id):
+  return db.func.int4range(column, column, db.literal_column("'[]'")) == \
+    db.func.int4range(entity_id, entity_id, db.literal_column("'[]'"))
+
+def booking_conflicts(venue_id, artist_id, start, end):
+  """Shows that a show of artist_id at venue_id over [start, end) would
+  overlap, earliest first."""
+  return Show.query.\
+    filter(db.or_(one_of(Show.venue_id, venue_id), one_of(Show.artist_id, artist_id))).\
+    filter(during(start, end)).\
+    order_by(Show.start_time).all()
+
+def is_booking_conflict(error):
+  """Whether an IntegrityError came from the exclusion constraints."""
+  return getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+def free_slots(venue_id, start, end, min_length=None):
+  """The gaps between venue_id's shows within [start, end), as (start, end)
+  pairs in order; gaps shorter than the min_length timedelta are left out."""
+  booked = db.session.query(Show.start_time, Show.end_time).\
+    filter(one_of(Show.venue_id, venue_id), during(start, end)).\
+    order_by(Show.start_time)
+  slots = []
+  free_from = start
+  for show_start, show_end in booked:
+    if show_start > free_from:
+      slots.append((free_from, show_start))
+    free_from = max(free_from, show_end)
+  if free_from < end:
+    slots.append((free_from, end))
+  if min_length is not None:
+    slots = [(a, b) for a, b in slots if b - a >= min_length]
+  return slots
+
+#----------------------------------------------------------------------------#
+# Bulk booking.
+#----------------------------------------------------------------------------#
+
+def insert_shows(rows):
+  """Insert (artist_id, venue_id, start_time, end_time) tuples with one
+  multi-row INSERT that skips every show overlapping another, including
+  an earlier row. Returns the new ids in the order of rows, None where a
+  row was skipped. Like any bulk write, it bypasses the counter hooks."""
+  columns = ', '.join(SHOW_COLUMNS)
+  cursor = db.session.connection().connection.cursor()
+  # DO NOTHING also covers the exclusion constraints; rows missing from
+  # RETURNING were skipped
+  returned = execute_values(
+    cursor,
+    'INSERT INTO shows (%s) VALUES %%s ON CONFLICT DO NOTHING RETURNING id, %s' % (columns, columns),
+    rows,
+    page_size=len(rows),
+    fetch=True
+  )
+  ids = {}
+  for show_id, *row in returned:
+    ids.setdefault(tuple(row), []).append(show_id)
+  return [ids[row].pop() if ids.get(row) else None for row in rows]
+
+def tour_date(venue_id, start_time):
+  """Parse one (venue_id, start_time) pair of a tour, from form or JSON
+  values. Returns the pair and an error, one of them None."""
+  try:
+    venue_id = int(venue_id)
+  except (TypeError, ValueError):
+    return None, 'venue_id must be a number'
+  try:
+    start_time = datetime.fromisoformat(str(start_time).strip())
+  except ValueError:
+    return None, 'start_time must look like YYYY-MM-DD HH:MM'
+  return (venue_id, start_time), None
+
+def book_tour(artist_id, dates, duration):
+  """Book artist_id at every (venue_id, start_time) pair of dates, given as
+  form or JSON values, for the duration timedelta, all or none.
+
+  All venue ids are checked with one query and the shows are written with
+  one INSERT. Returns the new show ids and {position in dates: error}; when
+  there are errors nothing was booked.
+  """
+  parsed = [tour_date(venue_id, start_time) for venue_id, start_time in dates]
+  errors = dict((i, error) for i, (_, error) in enumerate(parsed) if error)
+  dates = [date for date, _ in parsed]
+  venue_ids = set(date[0] for date in dates if date)
+  venues = set(i for i, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))) if venue_ids else set()
+  for i, date in enumerate(dates):
+    if date and date[0] not in venues:
+      errors[i] = 'No venue with id %d' % date[0]
+  if errors:
+    return [], errors
+
+  rows = [(artist_id, v, start, start + duration) for v, start in dates]
+  ids = insert_shows(rows)
+  if None not in ids:
+    count_new_shows(ids)
+    enqueue('recommend', venue_ids=sorted(venues), artist_ids=[artist_id])
+    db.session.commit()
+    return ids, {}
+
+  db.session.rollback()
+  # only now, for the rows that failed: what they overlap
+  for i, (_, venue_id, start, end) in enumerate(rows):
+    if ids[i] is None:
+      conflicts = booking_conflicts(venue_id, artist_id, start, end)
+      errors[i] = 'Overlaps ' + (', '.join('show %d (%s to %s)' % (c.id, c.start_time, c.end_time) for c in conflicts)
+                                 if conflicts else 'another date of this tour')
+  return [], errors
@@ -0,0 +1,63 @@
+import re
+
+from models import db
+from aio import async_reads
+from facets import filter_listing
+
+#----------------------------------------------------------------------------#
+# Full-text search.
+#----------------------------------------------------------------------------#
+
+# Venues and artists carry a search_vector tsvector column (name, genres,
+# city and state, weighted in that order) that is kept current by a trigger,
+# see migration 5e0c8a4f9d21. Every word of the search term is matched as a
+# prefix of a word, so "Music" finds "The Musical Hop" as the old ilike
+# search did, but unlike it a term never matches inside a word: "usical"
+# finds nothing. Matches can be narrowed down further with the listing
+# filters of facets.py.
+
+SEARCH_CONFIG = 'simple'
+
+def to_tsquery(term):
+  words = re.findall(r'\w+', term.lower())
+  if not words:
+    return None
+  return db.func.to_tsquery(SEARCH_CONFIG, ' & '.join(word + ':*' for word in words))
+
+def search_matches(model, term, filters=None):
+  """The unpaged (id, name, total) query behind full_text_search()."""
+  query = to_tsquery(term)
+  matches = filter_listing(db.session.query(model.id, model.name, db.func.count().over().label('total')),
+                           model, filters or {})
+  if query is not None:
+    rank = db.func.ts_rank_cd(model.search_vector, query)
+    matches = matches.filter(model.search_vector.op('@@')(query)).order_by(rank.desc())
+  return matches
+
+def search_count(matches):
+  return db.session.query(db.func.count()).select_from(matches.order_by(None).subquery())
+
+def search_page(matches, model, page, page_size):
+  return matches.order_by(model.name, model.id).limit(page_size).offset((page - 1) * page_size)
+
+def full_text_search(model, term, page=1, page_size=50, filters=None):
+  """Return one page of (id, name) rows of model matching term and the
+  listing filters, best first, and the total number of matches.
+
+  The total comes from a window function in the same statement. A term
+  without any words matches everything, ordered by name.
+  """
+  matches = search_matches(model, term, filters)
+  rows = search_page(matches, model, page, page_size).all()
+  if rows:
+    return rows, rows[0].total
+  # paged past the end, the window total is gone with the rows
+  return rows, (search_count(matches).scalar() if page > 1 else 0)
+
+async def full_text_search_async(model, term, page=1, page_size=50, filters=None):
+  """full_text_search() on the async driver."""
+  matches = search_matches(model, term, filters)
+  rows = await async_reads.fetch(search_page(matches, model, page, page_size))
+  if rows:
+    return rows, rows[0].total
+  return rows, (await async_reads.scalar(search_count(matches)) if page > 1 else 0)
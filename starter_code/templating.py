@@ -0,0 +1,103 @@
+import json
+import os
+import stat
+import time
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import MemoryBackend
+
+#----------------------------------------------------------------------------#
+# Templates.
+#----------------------------------------------------------------------------#
+
+# In production (see config.py) templates are compiled once at startup,
+# their bytecode is kept on disk so later processes skip the compiler, and
+# the filesystem is never checked for changes. Repeated blocks such as the
+# show cards are cached as rendered fragments:
+#
+#   {% cache 'venue-show', show %} ... {% endcache %}
+#
+# The key is the repr of the tag's arguments, so it should name everything
+# the block renders; entries then never need invalidating and only expire
+# to bound memory.
+
+class FragmentCacheExtension(Extension):
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super(FragmentCacheExtension, self).__init__(environment)
+    environment.extend(fragment_cache=None, fragment_cache_ttl=0)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    key = [parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      key.append(parser.parse_expression())
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    return nodes.CallBlock(self.call_method('_cache', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+  def _cache(self, key, caller):
+    cache = self.environment.fragment_cache
+    if cache is None:
+      return caller()
+    key = repr(key)
+    fragment = cache.get(key)
+    if fragment is None:
+      fragment = caller()
+      cache.set(key, fragment, self.environment.fragment_cache_ttl)
+    return Markup(fragment)
+
+def init_templates(app):
+  """Configure app.jinja_env from the TEMPLATE_* settings. Call it after
+  the filters are registered, since compiling checks them."""
+  env = app.jinja_env
+  env.add_extension(FragmentCacheExtension)
+
+  kind = app.config.get('TEMPLATE_BYTECODE_CACHE', 'none')
+  if kind == 'filesystem':
+    # bytecode is executed as it is loaded: whoever can write the directory
+    # can run code in the app. Without a directory Jinja uses, and checks,
+    # its own per-user one.
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if directory:
+      private_directory(directory)
+    env.bytecode_cache = FileSystemBytecodeCache(directory)
+  elif kind != 'none':
+    raise ValueError('Unknown TEMPLATE_BYTECODE_CACHE %r' % kind)
+
+  max_entries = app.config.get('TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES', 0)
+  if max_entries:
+    env.fragment_cache = MemoryBackend(max_entries)
+    env.fragment_cache_ttl = app.config.get('TEMPLATE_FRAGMENT_CACHE_TTL', 3600)
+
+  if app.config.get('TEMPLATE_PRECOMPILE'):
+    timings = precompile_templates(env)
+    app.logger.info(json.dumps({
+      "event": 'templates_compiled',
+      "templates": len(timings),
+      "ms": round(sum(timings.values()) * 1000, 2),
+      "bytecode_cache": kind,
+      "slowest": [{"template": name, "ms": round(seconds * 1000, 2)}
+                  for name, seconds in sorted(timings.items(), key=lambda t: t[1], reverse=True)[:3]]
+    }))
+
+def private_directory(directory):
+  """Create directory for the current user only, or check that it is
+  owned by the user and not writable by anyone else."""
+  os.makedirs(directory, mode=0o700, exist_ok=True)
+  st = os.lstat(directory)
+  if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+    raise RuntimeError('%s must be a directory owned by uid %d and writable only by it'
+                       % (directory, os.getuid()))
+
+def precompile_templates(env):
+  """Load every template into env's cache, return seconds per template."""
+  timings = {}
+  for name in env.list_templates(extensions=['html']):
+    started = time.perf_counter()
+    env.get_template(name)
+    timings[name] = time.perf_counter() - started
+  return timings
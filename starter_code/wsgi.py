@@ -0,0 +1,10 @@
+# Entry point for WSGI servers, e.g.
+#
+#   FYYUR_CONFIG=production gunicorn --preload -w 4 wsgi:app
+#
+# --preload builds the application once in the master process and forks
+# the workers from it.
+
+from app import create_app
+
+app = create_app()